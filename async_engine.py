@@ -0,0 +1,87 @@
+import asyncio
+import concurrent.futures
+import itertools
+import logging
+
+
+# Motor asyncio para acciones masivas.
+# Un único event loop mantiene miles de equipos "en vuelo". El pre-chequeo de
+# vida se hace por lotes (un sondeo ICMP/TCP por lote, en un hilo aparte para
+# no bloquear el loop) y sólo la etapa SSH, que usa llamadas bloqueantes de
+# paramiko, pasa por un ThreadPoolExecutor acotado. Así un barrido de una /16
+# no levanta miles de hilos del sistema operativo ni materializa la lista.
+
+_FIN = object()
+
+
+async def _ejecutar(hosts, etapa_vida, etapa_ssh, max_workers, max_en_vuelo, lote_vida, al_completar,
+                    acumular, resultado_error):
+    loop = asyncio.get_running_loop()
+    resultados = []
+    hosts = iter(hosts)
+    # Equipos clasificados esperando etapa SSH: si se llena, el sondeo del lote siguiente espera
+    cola = asyncio.Queue(maxsize=max_en_vuelo)
+
+    def error(ip, e):
+        return resultado_error(ip, e) if resultado_error else f"{ip}: Error - {e}"
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor_vida:
+        async def productor():
+            try:
+                while True:
+                    lote = list(itertools.islice(hosts, lote_vida))
+                    if not lote:
+                        return
+                    try:
+                        clasificados = await loop.run_in_executor(executor_vida, etapa_vida, lote)
+                    except Exception as e:
+                        logging.error(f"Error en la etapa de vida ({len(lote)} hosts): {e}")
+                        clasificados = [(ip, error(ip, e)) for ip in lote]
+                    for item in clasificados:
+                        await cola.put(item)
+            finally:
+                for _ in range(max_en_vuelo):
+                    await cola.put(_FIN)
+
+        async def trabajador():
+            while True:
+                item = await cola.get()
+                if item is _FIN:
+                    return
+                ip, resultado = item
+                if resultado is None:
+                    try:
+                        resultado = await loop.run_in_executor(executor, etapa_ssh, ip)
+                    except Exception as e:
+                        logging.error(f"{ip}: Error en la etapa SSH - {e}")
+                        resultado = error(ip, e)
+                if acumular:
+                    resultados.append(resultado)
+                if al_completar:
+                    al_completar(resultado)
+
+        await asyncio.gather(productor(), *(trabajador() for _ in range(max_en_vuelo)))
+
+    return resultados
+
+
+def ejecutar_async(hosts, etapa_vida, etapa_ssh, max_workers=10, max_en_vuelo=1000, lote_vida=1024,
+                   al_completar=None, acumular=True, resultado_error=None):
+    """
+    Ejecuta vida -> etapa_ssh(ip) sobre todos los hosts en un único event loop.
+    - etapa_vida(lote): función bloqueante que sondea un lote de hosts y retorna
+      [(ip, fallo)] con fallo None si hay que seguir con la etapa SSH, o el
+      resultado a informar. Corre en un hilo aparte, un lote de 'lote_vida' a la vez.
+    - etapa_ssh: función bloqueante (connect + comandos) que retorna el resultado del equipo.
+    - max_workers: hilos del executor para las llamadas paramiko.
+    - max_en_vuelo: equipos procesándose o esperando la etapa SSH a la vez.
+    - al_completar: callback opcional por cada resultado.
+    - resultado_error: función opcional (ip, excepción) que arma el resultado si una etapa falla.
+    - acumular: False para no guardar los resultados (sólo llegan a al_completar).
+    Retorna la lista de resultados en orden de finalización (vacía si acumular=False).
+    """
+    max_en_vuelo = max(1, min(max_en_vuelo, len(hosts)))
+    logging.info(f"Motor asyncio: {len(hosts)} hosts, {max_en_vuelo} en vuelo, {max_workers} hilos SSH")
+    return asyncio.run(_ejecutar(hosts, etapa_vida, etapa_ssh, max_workers, max_en_vuelo, lote_vida,
+                                 al_completar, acumular, resultado_error))
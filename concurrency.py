@@ -0,0 +1,108 @@
+import concurrent.futures
+import itertools
+import logging
+import threading
+import time
+
+
+class ControladorAIMD:
+    """
+    Controla la cantidad de equipos que se conectan a la vez (AIMD).
+    Cada 'ventana' handshakes evalúa los resultados: si los timeouts (banner
+    o TCP) superan 'umbral_timeouts' o la latencia media supera 'latencia_max'
+    baja el límite multiplicándolo por 'factor'; si no, lo sube en 'incremento'.
+    Los hilos llaman adquirir()/liberar() alrededor del trabajo SSH y
+    registrar() con el resultado de cada handshake.
+    """
+    def __init__(self, inicial=10, minimo=1, maximo=200, ventana=20, umbral_timeouts=0.1,
+                 latencia_max=5.0, factor=0.5, incremento=2, al_cambiar=None):
+        self.limite = max(minimo, min(inicial, maximo))
+        self.minimo = minimo
+        self.maximo = maximo
+        self.ventana = ventana
+        self.umbral_timeouts = umbral_timeouts
+        self.latencia_max = latencia_max
+        self.factor = factor
+        self.incremento = incremento
+        self.al_cambiar = al_cambiar
+        self.historial = [(time.monotonic(), self.limite)]
+        self._en_uso = 0
+        self._cond = threading.Condition()
+        self._exitos = 0
+        self._timeouts = 0
+        self._otros = 0
+        self._latencias = 0.0
+
+    def adquirir(self):
+        with self._cond:
+            while self._en_uso >= self.limite:
+                self._cond.wait()
+            self._en_uso += 1
+
+    def liberar(self):
+        with self._cond:
+            self._en_uso -= 1
+            self._cond.notify()
+
+    def registrar(self, exito, latencia=0.0, timeout=False):
+        """Registra un handshake: exitoso (con su latencia), timeout u otro error."""
+        with self._cond:
+            if exito:
+                self._exitos += 1
+                self._latencias += latencia
+            elif timeout:
+                self._timeouts += 1
+            else:
+                self._otros += 1
+            total = self._exitos + self._timeouts + self._otros
+            if total < self.ventana:
+                return
+            latencia_media = self._latencias / self._exitos if self._exitos else 0.0
+            tasa_timeouts = self._timeouts / total
+            anterior = self.limite
+            if tasa_timeouts > self.umbral_timeouts or latencia_media > self.latencia_max:
+                self.limite = max(self.minimo, int(self.limite * self.factor))
+                motivo = f"timeouts {tasa_timeouts:.0%}, latencia {latencia_media:.2f}s"
+            else:
+                self.limite = min(self.maximo, self.limite + self.incremento)
+                motivo = f"sano: timeouts {tasa_timeouts:.0%}, latencia {latencia_media:.2f}s"
+            self._exitos = self._timeouts = self._otros = 0
+            self._latencias = 0.0
+            if self.limite != anterior:
+                self.historial.append((time.monotonic(), self.limite))
+                self._cond.notify_all()
+            limite = self.limite
+        if limite != anterior:
+            logging.info(f"Concurrencia adaptativa: {anterior} -> {limite} ({motivo})")
+            if self.al_cambiar:
+                self.al_cambiar(limite, motivo)
+
+    def envolver(self, fn):
+        """Retorna fn(ip) limitada por el controlador."""
+        def envuelta(ip):
+            self.adquirir()
+            try:
+                return fn(ip)
+            finally:
+                self.liberar()
+        return envuelta
+
+
+def mapear_acotado(executor, fn, items, en_vuelo):
+    """
+    Como executor.map pero sin enviar todo de entrada: mantiene a lo sumo
+    'en_vuelo' tareas enviadas y toma el siguiente item del iterador (que
+    puede ser perezoso) recién cuando termina una. Así la memoria no depende
+    del largo de 'items'.
+    Genera los resultados en orden de finalización; una excepción de fn se
+    propaga al consumir su resultado.
+    """
+    items = iter(items)
+    pendientes = {executor.submit(fn, item) for item in itertools.islice(items, max(1, en_vuelo))}
+    while pendientes:
+        listos, pendientes = concurrent.futures.wait(pendientes, return_when=concurrent.futures.FIRST_COMPLETED)
+        # Se repone antes de entregar, para no dejar hilos ociosos mientras se procesa el resultado
+        for item in itertools.islice(items, len(listos)):
+            pendientes.add(executor.submit(fn, item))
+        for future in listos:
+            yield future.result()
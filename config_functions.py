@@ -3,6 +3,16 @@ import logging
 paramiko.util.log_to_file("paramiko.log")  # opcional, para log interno si lo querés
 logging.getLogger("paramiko").setLevel(logging.WARNING)
 import time
+import threading
+import socket
+import errno
+import os
+import json
+import tempfile
+import re
+import uuid
+from collections import OrderedDict
+from system_cfg import leer_snapshot, CLAVES_COUNTRYCODE
 
 # Decorador para reintentos
 def retry(max_attempts=3, delay=2):
@@ -49,19 +59,411 @@ class DummyOutput:
     def read(self):
         return b""
 
-def _connect_device(ip, username, password, timeout=10, banner_timeout=5, auth_timeout=5):
-    logging.info(f"Conectando a {ip} con usuario: {username} y contraseña: {password}...")
-    ssh = paramiko.SSHClient()
-    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    ssh.connect(
-        ip,
-        username=username,
-        password=password,
-        timeout=timeout,
-        banner_timeout=banner_timeout,
-        auth_timeout=auth_timeout
-    )
-    return ssh
+class TimeoutRemoto(Exception):
+    """Un comando remoto no terminó dentro de su plazo; el canal se abortó."""
+
+class _SalidaCanal:
+    """
+    stdout/stderr de un canal exec con plazo: read() y recv_exit_status() no
+    esperan más allá de 'limite' (time.monotonic). Si se vence, cierran el
+    canal y lanzan TimeoutRemoto.
+    """
+    def __init__(self, chan, limite, stderr=False):
+        self._chan = chan
+        self._limite = limite
+        self._stderr = stderr
+        self.channel = self
+
+    def _restante(self):
+        restante = self._limite - time.monotonic()
+        if restante <= 0:
+            self._abortar()
+        return restante
+
+    def _abortar(self):
+        self._chan.close()
+        raise TimeoutRemoto("el comando remoto no terminó dentro del plazo")
+
+    def read(self):
+        recv = self._chan.recv_stderr if self._stderr else self._chan.recv
+        partes = []
+        while True:
+            self._chan.settimeout(self._restante())
+            try:
+                datos = recv(65536)
+            except socket.timeout:
+                self._abortar()
+            if not datos:
+                return b"".join(partes)
+            partes.append(datos)
+
+    def recv_exit_status(self):
+        if not self._chan.status_event.wait(self._restante()):
+            self._abortar()
+        return self._chan.exit_status
+
+class SesionSSH:
+    """
+    Sesión SSH armada sobre un paramiko.Transport ya autenticado.
+    Expone la misma interfaz que paramiko.SSHClient que usan las funciones
+    de este módulo (exec_command, open_sftp, invoke_shell, get_transport, close).
+    Cada comando tiene un plazo de 'timeout_comando' segundos, recortado por
+    'plazo' (instante time.monotonic límite para todo el equipo, si se fijó
+    con fijar_plazos); vencido el plazo el canal se aborta con TimeoutRemoto.
+    """
+    def __init__(self, transport, timeout_comando=30):
+        self._transport = transport
+        self.timeout_comando = timeout_comando
+        self.plazo = None
+
+    def fijar_plazos(self, timeout_comando=None, plazo_equipo=None):
+        """Plazo por comando y, opcionalmente, plazo total en segundos a partir de ahora."""
+        if timeout_comando is not None:
+            self.timeout_comando = timeout_comando
+        self.plazo = time.monotonic() + plazo_equipo if plazo_equipo else None
+
+    def limite(self, timeout=None):
+        """Instante límite para un comando que empieza ahora."""
+        limite = time.monotonic() + (timeout or self.timeout_comando)
+        if self.plazo is not None:
+            limite = min(limite, self.plazo)
+        if limite <= time.monotonic():
+            raise TimeoutRemoto("se agotó el plazo del equipo")
+        return limite
+
+    def exec_command(self, command, timeout=None):
+        limite = self.limite(timeout)
+        chan = self._transport.open_session(timeout=limite - time.monotonic())
+        chan.exec_command(command)
+        stdin = chan.makefile_stdin("wb", -1)
+        return stdin, _SalidaCanal(chan, limite), _SalidaCanal(chan, limite, stderr=True)
+
+    def open_sftp(self):
+        return paramiko.SFTPClient.from_transport(self._transport)
+
+    def invoke_shell(self, term="vt100", width=80, height=24):
+        chan = self._transport.open_session()
+        chan.get_pty(term, width, height)
+        chan.invoke_shell()
+        return chan
+
+    def get_transport(self):
+        return self._transport
+
+    def close(self):
+        self._transport.close()
+
+def _open_transport(ip, timeout=10, banner_timeout=5, auth_timeout=5, port=22):
+    """Abre el socket y completa banner + KEX. No autentica."""
+    sock = socket.create_connection((ip, port), timeout=timeout)
+    try:
+        transport = paramiko.Transport(sock)
+        transport.banner_timeout = banner_timeout
+        transport.auth_timeout = auth_timeout
+        transport.start_client(timeout=timeout)
+    except Exception:
+        sock.close()
+        raise
+    return transport
+
+def _connect_device(ip, username, passwords, timeout=10, banner_timeout=5, auth_timeout=5):
+    """
+    Conecta al equipo probando cada contraseña de 'passwords' sobre un mismo
+    Transport: el KEX se hace una sola vez y luego se llama auth_password por
+    cada candidata. Si el servidor corta la conexión (p.ej. dropbear al llegar
+    a su máximo de intentos) se abre un transporte nuevo para las restantes.
+    Retorna (SesionSSH, password_usada). Propaga la última excepción si
+    ninguna contraseña funcionó.
+    """
+    pendientes = list(passwords)
+    ultimo_error = None
+    while pendientes:
+        logging.info(f"Conectando a {ip} con usuario: {username} ({len(pendientes)} contraseña/s a probar)...")
+        transport = _open_transport(ip, timeout, banner_timeout, auth_timeout)
+        probadas = 0
+        try:
+            while pendientes and transport.is_active():
+                pw = pendientes[0]
+                try:
+                    transport.auth_password(username, pw)
+                except paramiko.AuthenticationException as e:
+                    logging.error(f"{ip}: contraseña rechazada: {e}")
+                    ultimo_error = e
+                    pendientes.pop(0)
+                    probadas += 1
+                    continue
+                except paramiko.SSHException as e:
+                    # El servidor cerró la sesión durante la autenticación
+                    ultimo_error = e
+                    break
+                return SesionSSH(transport), pw
+        except Exception:
+            transport.close()
+            raise
+        transport.close()
+        if pendientes and probadas == 0:
+            break  # el servidor corta sin dejar probar ninguna; no insistir
+    raise ultimo_error or paramiko.AuthenticationException("Sin contraseñas para probar")
+
+class _SalidaShell:
+    """stdout/stderr de un comando de ShellPersistente, con la interfaz que usan los helpers."""
+    def __init__(self, shell, indice, campo):
+        self._shell = shell
+        self._indice = indice
+        self._campo = campo
+        self.channel = self
+
+    def read(self):
+        return self._shell._resultado(self._indice)[self._campo].encode()
+
+    def recv_exit_status(self):
+        return self._shell._resultado(self._indice)["exit_code"]
+
+class ShellPersistente:
+    """
+    Ejecuta varios comandos sobre un único canal invoke_shell por equipo.
+    Cada comando se envía apenas se llama exec_command (sin esperar al
+    anterior) rodeado de marcas únicas; la salida se lee como un flujo y se
+    separa por esas marcas, en orden, recién cuando alguien la pide.
+    exec_command devuelve (stdin, stdout, stderr) como SSHClient, así que
+    update_config, verify_update, persist_changes, check_country_mode, etc.
+    pueden recibir un ShellPersistente en lugar de la sesión SSH.
+    Cada lectura respeta el plazo por comando ('timeout', o el de la sesión)
+    y el del equipo; si se vence, la shell se cierra con TimeoutRemoto.
+    """
+    def __init__(self, ssh, timeout=None):
+        self._ssh = ssh
+        self._timeout = timeout
+        self._chan = ssh.invoke_shell()
+        self._id = uuid.uuid4().hex[:12]
+        self._err = f"/tmp/.isp_err_{self._id}"
+        self._buffer = ""
+        self._enviados = 0
+        self._leidos = 0
+        self._resultados = {}
+        # Sin eco ni prompt; luego se descarta todo (banner, prompt) hasta la primera marca
+        self._chan.sendall("stty -echo 2>/dev/null; PS1=''; PS2=''; export PS1 PS2\n")
+        self._resultado(self._enviar("true"))
+
+    def _marca(self, indice, tipo):
+        return f"__ISP_{self._id}_{indice}_{tipo}__"
+
+    def _enviar(self, comando):
+        indice = self._enviados
+        self._enviados += 1
+        ini, fin, err = (self._marca(indice, t) for t in ("INI", "FIN", "ERR"))
+        # Subshell: un 'exit' del comando no cierra la shell persistente
+        self._chan.sendall(
+            f"printf '%s\\n' '{ini}'; ( {comando}\n) </dev/null 2>{self._err}; rc=$?; "
+            f"printf '\\n%s %s\\n' '{fin}' $rc; cat {self._err}; printf '%s\\n' '{err}'\n"
+        )
+        return indice
+
+    def _leer_linea_marca(self, patron, limite):
+        """Lee del canal hasta encontrar 'patron' o hasta 'limite'; retorna (texto_previo, match)."""
+        while True:
+            match = patron.search(self._buffer)
+            if match:
+                previo = self._buffer[:match.start()]
+                self._buffer = self._buffer[match.end():]
+                return previo, match
+            restante = limite - time.monotonic()
+            try:
+                if restante <= 0:
+                    raise socket.timeout()
+                self._chan.settimeout(restante)
+                datos = self._chan.recv(65536)
+            except socket.timeout:
+                self._chan.close()  # la shell queda desincronizada: no se reutiliza
+                raise TimeoutRemoto("el comando remoto no terminó dentro del plazo")
+            if not datos:
+                raise paramiko.SSHException("La shell remota se cerró antes de terminar el comando")
+            self._buffer += datos.decode(errors="replace").replace("\r\n", "\n")
+
+    def _resultado(self, indice):
+        while indice not in self._resultados:
+            actual = self._leidos
+            ini, fin, err = (re.escape(self._marca(actual, t)) for t in ("INI", "FIN", "ERR"))
+            limite = self._ssh.limite(self._timeout)  # plazo por comando y del equipo de la sesión
+            # Las marcas no se anclan al inicio de línea (puede precederlas un prompt),
+            # pero sí al salto de línea: el eco del comando las muestra seguidas de comillas.
+            self._leer_linea_marca(re.compile(f"{ini}\\n"), limite)
+            salida, match = self._leer_linea_marca(re.compile(f"\\n{fin} (\\d+)\\n"), limite)
+            error, _ = self._leer_linea_marca(re.compile(f"{err}\\n"), limite)
+            self._resultados[actual] = {
+                "stdout": salida,
+                "stderr": error,
+                "exit_code": int(match.group(1)),
+            }
+            self._leidos += 1
+        return self._resultados[indice]
+
+    def exec_command(self, command, timeout=None):
+        indice = self._enviar(command)
+        return None, _SalidaShell(self, indice, "stdout"), _SalidaShell(self, indice, "stderr")
+
+    def ejecutar_lote(self, comandos):
+        """Envía todos los comandos de una vez y retorna [(stdout, stderr, exit_code), ...]."""
+        indices = [self._enviar(c) for c in comandos]
+        return [(r["stdout"], r["stderr"], r["exit_code"]) for r in (self._resultado(i) for i in indices)]
+
+    def close(self):
+        try:
+            self._chan.sendall(f"rm -f {self._err}; exit\n")
+        except Exception:
+            pass
+        self._chan.close()
+
+# Clases de error de conexión. Sólo ERROR_AUTH justifica probar otra contraseña:
+# las demás indican que el equipo (o su sshd) no está disponible.
+ERROR_TCP = "tcp"        # conexión rechazada o host inalcanzable
+ERROR_TIMEOUT = "timeout"  # el connect TCP no terminó a tiempo
+ERROR_BANNER = "banner"  # el sshd no envió el banner a tiempo
+ERROR_KEX = "kex"        # falló la negociación de claves/cifrado
+ERROR_AUTH = "auth"      # credencial rechazada
+
+_estado_conexion = threading.local()
+
+def clasificar_error_conexion(exc):
+    """
+    Clasifica una excepción de conexión SSH en ERROR_TCP, ERROR_TIMEOUT,
+    ERROR_BANNER, ERROR_KEX o ERROR_AUTH.
+    """
+    if isinstance(exc, paramiko.AuthenticationException):
+        return ERROR_AUTH
+    if isinstance(exc, socket.timeout) or getattr(exc, "errno", None) == errno.ETIMEDOUT:
+        return ERROR_TIMEOUT
+    if isinstance(exc, (paramiko.ssh_exception.NoValidConnectionsError, socket.timeout, OSError)):
+        return ERROR_TCP
+    if isinstance(exc, paramiko.SSHException) and "banner" in str(exc).lower():
+        return ERROR_BANNER
+    return ERROR_KEX
+
+def ultimo_error_conexion():
+    """Clase del último error de conexión ocurrido en este hilo (o None si conectó)."""
+    return getattr(_estado_conexion, "error", None)
+
+def sesion_reutilizada():
+    """True si el último SSHSessionPool.acquire de este hilo entregó una sesión del pool (sin handshake)."""
+    return getattr(_estado_conexion, "reutilizada", False)
+
+class CredentialCache:
+    """
+    Cache en disco de la credencial que funcionó por IP.
+    Guarda el índice dentro de [password] + alt_passwords para probarlo
+    primero en la próxima conexión. set/invalidate sólo cambian la memoria y
+    anotan el cambio; guardar() (una vez por acción) relee el archivo, le
+    aplica los cambios anotados y lo reemplaza de forma atómica (temporal
+    único + os.replace), así varias instancias no se pisan las entradas.
+    En el motor "procesos" los hijos no escriben: sus cambios vuelven al
+    proceso principal con extraer_cambios() y se aplican con fusionar().
+    """
+    def __init__(self, ruta="cred_cache.json"):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._datos = self._leer()
+        self._cambios = {}   # ip -> índice, o None si se invalidó; pendientes de guardar
+
+    def _leer(self):
+        if not os.path.exists(self.ruta):
+            return {}
+        try:
+            with open(self.ruta, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            logging.error(f"No se pudo leer la cache de credenciales {self.ruta}: {e}")
+            return {}
+
+    def get(self, ip):
+        with self._lock:
+            return self._datos.get(ip)
+
+    def set(self, ip, indice):
+        with self._lock:
+            if self._datos.get(ip) == indice:
+                return
+            self._datos[ip] = indice
+            self._cambios[ip] = indice
+
+    def invalidate(self, ip):
+        with self._lock:
+            if self._datos.pop(ip, None) is not None:
+                self._cambios[ip] = None
+
+    def extraer_cambios(self):
+        """Cambios pendientes de guardar ({ip: índice o None}); quedan descartados en esta instancia."""
+        with self._lock:
+            cambios, self._cambios = self._cambios, {}
+        return cambios
+
+    def fusionar(self, cambios):
+        """Aplica cambios de otra instancia (un proceso hijo) como si se hubieran hecho aquí."""
+        with self._lock:
+            for ip, indice in cambios.items():
+                if indice is None:
+                    self._datos.pop(ip, None)
+                else:
+                    self._datos[ip] = indice
+                self._cambios[ip] = indice
+
+    def guardar(self):
+        """Escribe los cambios pendientes, si los hay, sobre lo que haya en disco."""
+        with self._lock:
+            if not self._cambios:
+                return
+            datos = self._leer()
+            for ip, indice in self._cambios.items():
+                if indice is None:
+                    datos.pop(ip, None)
+                else:
+                    datos[ip] = indice
+            directorio = os.path.dirname(os.path.abspath(self.ruta))
+            fd, tmp = tempfile.mkstemp(prefix=".cred_cache_", suffix=".tmp", dir=directorio)
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(datos, f)
+                os.replace(tmp, self.ruta)
+            except Exception as e:
+                logging.error(f"No se pudo guardar la cache de credenciales {self.ruta}: {e}")
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                return
+            self._datos.update(datos)
+            self._cambios = {}
+
+def _connect_with_fallback(ip, username, password, timeout=10, alt_password=None,
+                           banner_timeout=5, auth_timeout=5, cred_cache=None):
+    """
+    Igual que connect_device pero retorna (ssh, password_usada) para que el
+    pool de sesiones pueda indexar la conexión por la credencial que funcionó.
+    Las contraseñas alternativas se prueban sobre el mismo transporte y sólo
+    después de un rechazo de autenticación (ERROR_AUTH); ante errores TCP,
+    de banner o de KEX se abandona el equipo.
+    Si se pasa cred_cache, la credencial aprendida para la IP se prueba
+    primero y la cache se actualiza (o invalida) según el resultado.
+    Retorna (None, None) si ninguna contraseña sirvió.
+    """
+    alt_list = [alt_password] if isinstance(alt_password, str) else (alt_password or [])
+    candidatas = [password] + list(alt_list)
+    cacheado = cred_cache.get(ip) if cred_cache is not None else None
+    orden = list(candidatas)
+    if isinstance(cacheado, int) and 0 <= cacheado < len(candidatas):
+        orden.insert(0, orden.pop(cacheado))
+        logging.info(f"{ip}: probando primero la credencial aprendida (índice {cacheado}).")
+    _estado_conexion.error = None
+    try:
+        ssh, pw = _connect_device(ip, username, orden, timeout, banner_timeout, auth_timeout)
+    except Exception as e:
+        clase = clasificar_error_conexion(e)
+        _estado_conexion.error = clase
+        logging.error(f"Error conectando a {ip} [{clase}]: {e}")
+        if cred_cache is not None and clase == ERROR_AUTH:
+            cred_cache.invalidate(ip)
+        return None, None  # Si ninguna funcionó
+
+    if cred_cache is not None:
+        cred_cache.set(ip, candidatas.index(pw))
+    return ssh, pw
 
 def connect_device(ip, username, password, timeout=10, dry_run=False, alt_password=None,
                    banner_timeout=5, auth_timeout=5):
@@ -73,32 +475,159 @@ def connect_device(ip, username, password, timeout=10, dry_run=False, alt_passwo
     if dry_run:
         logging.info(f"DRY-RUN: Simulando conexión a {ip} (username: {username})")
         return DummySSH()
-    
-    # Intento con la contraseña principal
-    try:
-        return _connect_device(ip, username, password, timeout, banner_timeout, auth_timeout)
-    except Exception as e:
-        logging.error(f"Error conectando a {ip} con la contraseña primaria: {e}")
 
-    # Intento con contraseñas alternativas si existen
-    if alt_password:
-        alt_list = [alt_password] if isinstance(alt_password, str) else alt_password
-        for idx, alt in enumerate(alt_list, start=1):
-            try:
-                logging.info(f"Intentando conectar a {ip} con contraseña alternativa {idx}...")
-                return _connect_device(ip, username, alt, timeout, banner_timeout, auth_timeout)
-            except Exception as e2:
-                logging.error(f"Error conectando a {ip} con alternativa {idx}: {e2}")
-
-    return None  # Si ninguna funcionó
+    ssh, _ = _connect_with_fallback(ip, username, password, timeout, alt_password,
+                                    banner_timeout, auth_timeout)
+    return ssh
 
             
+class SSHSessionPool:
+    """
+    Pool de sesiones SSH reutilizables entre acciones del menú.
+    Las sesiones se indexan por (ip, usuario, contraseña que funcionó), de modo
+    que una "consulta" seguida de una "actualización" sobre los mismos equipos
+    reutiliza el transporte paramiko ya autenticado en lugar de repetir
+    TCP + KEX + auth. Cada sesión se entrega a un solo hilo a la vez.
+    """
+    def __init__(self, max_size=1024, idle_timeout=300):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # clave -> {"ssh": ..., "last_used": ..., "in_use": bool}
+        self._sessions = OrderedDict()
+
+    @staticmethod
+    def _is_alive(ssh):
+        transport = ssh.get_transport() if hasattr(ssh, "get_transport") else None
+        if transport is None or not transport.is_active():
+            return False
+        try:
+            transport.send_ignore()
+        except Exception:
+            return False
+        return True
+
+    def _close_entry(self, key, entry):
+        try:
+            entry["ssh"].close()
+        except Exception:
+            pass
+        logging.info(f"[{key[0]}] Sesión SSH cerrada y retirada del pool.")
+
+    def _evict(self):
+        """Retira sesiones ociosas vencidas y, si se excede max_size, las más viejas libres."""
+        now = time.monotonic()
+        for key, entry in list(self._sessions.items()):
+            if not entry["in_use"] and now - entry["last_used"] > self.idle_timeout:
+                del self._sessions[key]
+                self._close_entry(key, entry)
+        while len(self._sessions) > self.max_size:
+            libre = next((k for k, e in self._sessions.items() if not e["in_use"]), None)
+            if libre is None:
+                break
+            self._close_entry(libre, self._sessions.pop(libre))
+
+    def acquire(self, ip, username, password, alt_password=None, dry_run=False, **kwargs):
+        """
+        Retorna una sesión viva para el equipo, reutilizando una del pool si
+        existe. Si no, conecta con connect_device y la registra. Retorna None
+        si no se pudo conectar. En dry-run no se usa el pool.
+        """
+        _estado_conexion.reutilizada = False
+        if dry_run:
+            return connect_device(ip, username, password, dry_run=True)
+
+        alt_list = [alt_password] if isinstance(alt_password, str) else (alt_password or [])
+        candidatos = [(ip, username, pw) for pw in [password] + list(alt_list)]
+        with self._lock:
+            self._evict()
+            for key in candidatos:
+                entry = self._sessions.get(key)
+                if entry is None or entry["in_use"]:
+                    continue
+                if self._is_alive(entry["ssh"]):
+                    entry["in_use"] = True
+                    self._sessions.move_to_end(key)
+                    self.hits += 1
+                    _estado_conexion.reutilizada = True
+                    logging.info(f"[{ip}] Reutilizando sesión SSH del pool.")
+                    return entry["ssh"]
+                del self._sessions[key]
+                self._close_entry(key, entry)
+            self.misses += 1
+
+        ssh, pw_usada = _connect_with_fallback(ip, username, password, alt_password=alt_password, **kwargs)
+        if ssh is None:
+            return None
+        key = (ip, username, pw_usada)
+        with self._lock:
+            anterior = self._sessions.get(key)
+            if anterior is None or not anterior["in_use"]:
+                if anterior is not None:
+                    self._close_entry(key, anterior)
+                self._sessions[key] = {"ssh": ssh, "last_used": time.monotonic(), "in_use": True}
+            self._evict()
+        return ssh
+
+    def release(self, ssh):
+        """Devuelve la sesión al pool. Si no está registrada (pool lleno), la cierra."""
+        with self._lock:
+            for key, entry in self._sessions.items():
+                if entry["ssh"] is ssh:
+                    entry["in_use"] = False
+                    entry["last_used"] = time.monotonic()
+                    self._evict()
+                    return
+        ssh.close()
+
+    def discard(self, ssh):
+        """Cierra la sesión y la retira del pool (error, reboot, etc.)."""
+        with self._lock:
+            for key, entry in list(self._sessions.items()):
+                if entry["ssh"] is ssh:
+                    del self._sessions[key]
+                    break
+        try:
+            ssh.close()
+        except Exception:
+            pass
+
+    def close_all(self):
+        with self._lock:
+            for key, entry in list(self._sessions.items()):
+                self._close_entry(key, entry)
+            self._sessions.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "abiertas": len(self._sessions)}
+
+    def extraer_contadores(self):
+        """Hits y misses desde la última extracción, y los pone en cero (motor procesos, en el hijo)."""
+        with self._lock:
+            contadores = {"hits": self.hits, "misses": self.misses}
+            self.hits = self.misses = 0
+            return contadores
+
+    def sumar_contadores(self, contadores):
+        """Suma los contadores que devolvió extraer_contadores en otro proceso."""
+        with self._lock:
+            self.hits += contadores["hits"]
+            self.misses += contadores["misses"]
+
+def _comando_sed_countrycode(old_code, new_code, remote_filepath):
+    # Anclado a la línea completa, igual que el grep que decide si hace falta cambiar
+    return f'sed -i "s/^\\(radio\\(\\.1\\)\\?\\.countrycode=\\){old_code}$/\\1{new_code}/" {remote_filepath}'
+
 def update_config(ssh, ip, old_code, new_code, remote_filepath="/tmp/system.cfg", dry_run=False):
     """
     Ejecuta el comando sed para reemplazar tanto 'radio.countrycode=old_code'
-    como 'radio.1.countrycode=old_code' por el nuevo valor.
+    como 'radio.1.countrycode=old_code' por el nuevo valor (sólo líneas cuyo
+    valor es exactamente old_code).
     """
-    command_sed = f'sed -i "s/\\(radio\\(\\.1\\)\\?\\.countrycode=\\){old_code}/\\1{new_code}/g" {remote_filepath}'
+    command_sed = _comando_sed_countrycode(old_code, new_code, remote_filepath)
     if dry_run:
         logging.info(f"[{ip}] DRY-RUN: Se ejecutaría: {command_sed}")
     else:
@@ -123,6 +652,67 @@ def verify_update(ssh, ip, remote_filepath="/tmp/system.cfg", dry_run=False):
         verification_output = stdout.read().decode().strip()
         logging.info(f"[{ip}] Verificación: {verification_output}")
 
+def _sq(texto):
+    """Cita un texto para el shell remoto entre comillas simples."""
+    return "'" + str(texto).replace("'", "'\"'\"'") + "'"
+
+def _script_parametros(parametros, remote_filepath, persistir=False):
+    """
+    Arma un único script sh que aplica todas las claves con sed sobre
+    remote_filepath. Por cada clave imprime '@@OK clave', '@@AUSENTE clave'
+    (no existe la línea, no se agrega) o '@@FALLO clave', y termina con
+    exit 1 si alguna falló. Con persistir=True, si todas salieron bien
+    corre cfgmtd en el mismo script e informa '@@CFGMTD rc'.
+    """
+    lineas = [f"F={_sq(remote_filepath)}", "rc=0"]
+    for clave, valor in parametros.items():
+        patron = "^" + re.sub(r"([.\[\]*^$\\|])", r"\\\1", clave) + "="
+        reemplazo = re.sub(r"([\\|&])", r"\\\1", f"{clave}={valor}")
+        lineas.append(
+            f"if grep -q {_sq(patron)} \"$F\"; then "
+            f"if sed -i {_sq(f's|{patron}.*|{reemplazo}|')} \"$F\"; then echo {_sq('@@OK ' + clave)}; "
+            f"else echo {_sq('@@FALLO ' + clave)}; rc=1; fi; "
+            f"else echo {_sq('@@AUSENTE ' + clave)}; fi"
+        )
+    if persistir:
+        lineas.append('if [ $rc -eq 0 ]; then cfgmtd -f "$F" -w; rc=$?; echo "@@CFGMTD $rc"; fi')
+    lineas.append("exit $rc")
+    return "\n".join(lineas)
+
+def aplicar_parametros(ssh, ip, parametros, remote_filepath="/tmp/system.cfg", dry_run=False, persistir=False):
+    """
+    Aplica todo el set de parámetros (clave=valor) en un único canal SSH y
+    espera su exit status, de modo que cfgmtd pueda correr recién cuando
+    terminaron todas las ediciones. Con persistir=True cfgmtd corre al final
+    del mismo script; un exit_code distinto de 0 sin claves en FALLO indica
+    que falló cfgmtd.
+    Retorna (exit_code, {clave: "OK" | "AUSENTE" | "FALLO"}).
+    """
+    if not parametros and not persistir:
+        return 0, {}  # nada que enviar
+    script = _script_parametros(parametros, remote_filepath, persistir)
+    if dry_run:
+        logging.info(f"[{ip}] DRY-RUN: Se ejecutaría:\n{script}")
+        return 0, {clave: "OK" for clave in parametros}
+
+    stdin, stdout, stderr = ssh.exec_command(script)
+    salida = stdout.read().decode()
+    exit_code = stdout.channel.recv_exit_status()
+    reporte = {}
+    for linea in salida.splitlines():
+        if linea.startswith("@@") and " " in linea:
+            estado, clave = linea[2:].split(" ", 1)
+            if estado != "CFGMTD":
+                reporte[clave] = estado
+    for clave in parametros:
+        reporte.setdefault(clave, "FALLO")  # el script se cortó antes de llegar a esta clave
+    if exit_code != 0:
+        error_message = stderr.read().decode().strip()
+        logging.error(f"[{ip}] Error aplicando parámetros (exit code {exit_code}): {error_message}")
+    else:
+        logging.info(f"[{ip}] Parámetros aplicados en {remote_filepath}: {reporte}")
+    return exit_code, reporte
+
 def persist_changes(ssh, ip, remote_filepath="/tmp/system.cfg", dry_run=False):
     """
     Persiste los cambios en la flash del dispositivo usando cfgmtd.
@@ -168,52 +758,190 @@ def check_country_mode(ssh, ip, remote_filepath="/tmp/system.cfg", dry_run=False
         lines = stdout.read().decode().strip().splitlines()
         if not lines:
             logging.warning(f"{ip}: No se encontró la línea de countrycode en {remote_filepath}, asumiendo Licensed (511).")
-            return {"radio.countrycode": "511"}
-        result = {}
-        for line in lines:
-            if "=" in line:
-                key, value = line.split("=", 1)
-                result[key.strip()] = value.strip()
-        return result
+        return _parsear_countrycode(lines)
+
+def _parsear_countrycode(lineas):
+    """Convierte las líneas 'clave=valor' del grep en dict; sin líneas se asume Licensed (511)."""
+    result = {}
+    for line in lineas:
+        if "=" in line:
+            key, value = line.split("=", 1)
+            result[key.strip()] = value.strip()
+    return result or {"radio.countrycode": "511"}
 
-def corregir_mtu_pppoe(ssh, ip, dry_run=False, do_reboot=False):
+def _script_update_fusionado(old_code, new_code, remote_filepath):
     """
-    Verifica si el CPE tiene ppp.1.mtu o ppp.1.mru distintos de 1492 y los corrige si es necesario.
+    Script sh que en un solo canal lee las líneas de countrycode, decide si
+    hace falta cambiar (alguna línea en old_code), aplica el sed, vuelve a
+    leer y persiste con cfgmtd.
+    Imprime un bloque de estado:
+        @@ANTES ... @@FIN, @@SED rc, @@DESPUES ... @@FIN, @@CFGMTD rc, @@ESTADO X
+    con X = SIN_CAMBIOS | ACTUALIZADO | ERROR.
     """
-    try:
-        sftp = ssh.open_sftp()
-        remote_path = "/tmp/system.cfg"
-        local_temp = f"/tmp/system_{ip.replace('.', '_')}.cfg"
+    # Sin líneas de countrycode el equipo está en Licensed (511)
+    sin_lineas = "else echo '@@ESTADO SIN_CAMBIOS'; exit 0; fi" if new_code == "511" else "fi"
+    return "\n".join([
+        f"F={_sq(remote_filepath)}",
+        "P='^radio\\(\\.1\\)\\?\\.countrycode'",
+        "echo @@ANTES",
+        'grep "$P" "$F"',
+        "echo @@FIN",
+        'if grep -q "$P" "$F"; then',
+        f'  if [ -z "$(grep "$P" "$F" | grep -v {_sq("=" + new_code + "$")})" ]; then echo "@@ESTADO SIN_CAMBIOS"; exit 0; fi',
+        sin_lineas,
+        # Ninguna línea en old_code: el sed no cambiaría nada, no se escribe en flash
+        f'if ! grep -q "$P"{_sq("=" + old_code + "$")} "$F"; then echo "@@ESTADO SIN_CAMBIOS"; exit 0; fi',
+        _comando_sed_countrycode(old_code, new_code, '"$F"') + "; rc=$?",
+        'echo "@@SED $rc"',
+        'if [ $rc -ne 0 ]; then echo "@@ESTADO ERROR"; exit $rc; fi',
+        "echo @@DESPUES",
+        'grep "$P" "$F"',
+        "echo @@FIN",
+        'cfgmtd -f "$F" -w; rc=$?',
+        'echo "@@CFGMTD $rc"',
+        'if [ $rc -eq 0 ]; then echo "@@ESTADO ACTUALIZADO"; else echo "@@ESTADO ERROR"; fi',
+        "exit $rc",
+    ])
 
-        sftp.get(remote_path, local_temp)
+def _parsear_estado_fusionado(salida):
+    resultado = {"antes": None, "despues": None, "sed": None, "cfgmtd": None, "estado": "ERROR"}
+    bloque = None
+    lineas = []
+    for linea in salida.splitlines():
+        linea = linea.strip()
+        if linea in ("@@ANTES", "@@DESPUES"):
+            bloque, lineas = linea[2:].lower(), []
+        elif linea == "@@FIN" and bloque:
+            resultado[bloque] = _parsear_countrycode(lineas)
+            bloque = None
+        elif bloque:
+            lineas.append(linea)
+        elif linea.startswith("@@SED "):
+            resultado["sed"] = int(linea.split()[1])
+        elif linea.startswith("@@CFGMTD "):
+            resultado["cfgmtd"] = int(linea.split()[1])
+        elif linea.startswith("@@ESTADO "):
+            resultado["estado"] = linea.split()[1]
+    return resultado
 
-        with open(local_temp, "r") as f:
-            cfg_lines = f.readlines()
+def actualizar_country_code_fusionado(ssh, ip, old_code, new_code, remote_filepath="/tmp/system.cfg", dry_run=False):
+    """
+    Hace en un único exec_command lo que check_country_mode, update_config,
+    verify_update y persist_changes hacen en cuatro. Sólo aplica el sed y
+    cfgmtd si alguna línea de countrycode está en old_code.
+    Retorna un dict con 'estado' (SIN_CAMBIOS | ACTUALIZADO | ERROR),
+    'antes'/'despues' (dict de countrycode), 'sed'/'cfgmtd' (exit codes),
+    'exit_code' y 'error' (stderr si falló).
+    """
+    script = _script_update_fusionado(old_code, new_code, remote_filepath)
+    if dry_run:
+        logging.info(f"[{ip}] DRY-RUN: Se ejecutaría:\n{script}")
+        antes = {"radio.countrycode": old_code, "radio.1.countrycode": old_code}
+        return {"estado": "ACTUALIZADO", "antes": antes, "despues": antes, "sed": 0, "cfgmtd": 0,
+                "exit_code": 0, "error": ""}
 
-        mtu_line = next((line for line in cfg_lines if "ppp.1.mtu=" in line), None)
-        mru_line = next((line for line in cfg_lines if "ppp.1.mru=" in line), None)
+    stdin, stdout, stderr = ssh.exec_command(script)
+    salida = stdout.read().decode()
+    exit_code = stdout.channel.recv_exit_status()
+    resultado = _parsear_estado_fusionado(salida)
+    resultado["exit_code"] = exit_code
+    resultado["error"] = stderr.read().decode().strip() if exit_code != 0 else ""
+    if resultado["estado"] == "ERROR":
+        logging.error(f"[{ip}] Actualización fusionada falló (sed {resultado['sed']}, cfgmtd {resultado['cfgmtd']}): {resultado['error']}")
+    else:
+        logging.info(f"[{ip}] Actualización fusionada: {resultado['estado']} {resultado['antes']} -> {resultado['despues']}")
+    return resultado
 
-        mtu_ok = mtu_line and mtu_line.strip().endswith("1492")
-        mru_ok = mru_line and mru_line.strip().endswith("1492")
+def reconciliar(ssh, ip, snapshot, deseado, remote_filepath="/tmp/system.cfg", dry_run=False):
+    """
+    Lleva el equipo al estado 'deseado' ({clave: valor}) partiendo del snapshot
+    de system.cfg: calcula en memoria las claves que difieren y, sólo si hay
+    alguna, las aplica y persiste con cfgmtd en un único comando. Si no hay
+    diferencias no se escribe en flash (y el llamador no debe reiniciar).
+    Las claves que no existen en el archivo no se agregan.
+    snapshot=None sólo en dry-run: el estado es desconocido y se asume que
+    todas las claves cambian.
+    Retorna un dict con 'estado' (SIN_CAMBIOS | APLICADO | ERROR), 'cambios',
+    'reporte' ({clave: OK | SIN_CAMBIO | AUSENTE | FALLO}) y 'exit_code'.
+    """
+    if snapshot is None:
+        cambios = {clave: str(valor) for clave, valor in deseado.items()}
+        reporte = {}
+    else:
+        cambios = snapshot.diff(deseado)
+        reporte = {clave: "AUSENTE" if clave not in snapshot else "SIN_CAMBIO" for clave in deseado}
+    if not cambios:
+        logging.info(f"[{ip}] Ya está en el estado deseado: no se escribe en flash.")
+        return {"estado": "SIN_CAMBIOS", "cambios": {}, "reporte": reporte, "exit_code": 0}
+
+    exit_code, aplicado = aplicar_parametros(ssh, ip, cambios, remote_filepath, dry_run=dry_run, persistir=True)
+    reporte.update(aplicado)
+    if exit_code == 0 and snapshot is not None:
+        snapshot.actualizar(cambios)
+    return {"estado": "APLICADO" if exit_code == 0 else "ERROR", "cambios": cambios, "reporte": reporte,
+            "exit_code": exit_code}
 
-        if mtu_ok and mru_ok:
-            print(f"{ip:<16} -> ✅ MTU y MRU ya están correctos (1492)")
-            return
+def deseado_countrycode(snapshot, old_code, new_code):
+    """
+    Estado deseado de countrycode: las líneas que están en old_code pasan a
+    new_code (las demás no se tocan). Sin snapshot (dry-run) se asumen ambas
+    líneas en old_code.
+    """
+    if snapshot is None:
+        return {clave: new_code for clave in CLAVES_COUNTRYCODE}
+    return {clave: new_code for clave, valor in snapshot.countrycode().items()
+            if valor == old_code and clave in snapshot}
 
-        print(f"{ip:<16} -> 🛠️ Corrigiendo MTU/MRU PPPoE (MTU: {mtu_line.strip() if mtu_line else 'N/A'}, MRU: {mru_line.strip() if mru_line else 'N/A'})")
+def actualizar_country_code_snapshot(ssh, ip, snapshot, old_code, new_code, remote_filepath="/tmp/system.cfg",
+                                     dry_run=False):
+    """
+    Variante de actualizar_country_code_fusionado para cuando ya se tiene el
+    system.cfg en memoria: las líneas de countrycode en old_code se reconcilian
+    a new_code y al equipo sólo se envía lo que cambia (más cfgmtd).
+    Retorna el mismo dict que actualizar_country_code_fusionado.
+    """
+    antes = snapshot.countrycode()
+    r = reconciliar(ssh, ip, snapshot, deseado_countrycode(snapshot, old_code, new_code), remote_filepath,
+                    dry_run=dry_run)
+    sed_ok = "FALLO" not in r["reporte"].values()
+    return {
+        "estado": {"APLICADO": "ACTUALIZADO"}.get(r["estado"], r["estado"]),
+        "antes": antes,
+        "despues": snapshot.countrycode() if r["estado"] == "APLICADO" else None,
+        "sed": 0 if sed_ok else 1,
+        "cfgmtd": r["exit_code"] if sed_ok and r["cambios"] else None,
+        "exit_code": r["exit_code"],
+        "error": "" if r["exit_code"] == 0 else f"claves: {r['reporte']}",
+    }
 
-        if not dry_run:
-            cmds = [
-                "sed -i 's/^ppp\\.1\\.mtu=.*/ppp.1.mtu=1492/' /tmp/system.cfg",
-                "sed -i 's/^ppp\\.1\\.mru=.*/ppp.1.mru=1492/' /tmp/system.cfg",
-                "cfgmtd -f /tmp/system.cfg -w"
-            ]
-            for cmd in cmds:
-                ssh.exec_command(cmd)
+def corregir_mtu_pppoe(ssh, ip, dry_run=False, do_reboot=False, snapshot=None, mtu=1492):
+    """
+    Verifica si el CPE tiene ppp.1.mtu o ppp.1.mru distintos de 'mtu' y los corrige si es necesario.
+    Usa el snapshot de system.cfg si se lo pasa (si no, lo lee en memoria con
+    un único cat, sin archivo temporal) y envía sólo las claves que difieren,
+    más cfgmtd, en un único canal cuyo exit status se espera.
+    Si ya están correctos no se escribe en flash ni se reinicia.
+    No escribe en consola; los errores de SSH se propagan al llamador.
+    Retorna un dict con 'estado' (SIN_CAMBIOS | SIN_LINEAS | APLICADO | ERROR),
+    'antes' ({"ppp.1.mtu": v, "ppp.1.mru": v}, None si no existe), 'reporte',
+    'exit_code' y 'reboot' (True si se pidió el reinicio).
+    """
+    if snapshot is None and not dry_run:
+        snapshot = leer_snapshot(ssh, ip)
 
-            if do_reboot:
-                ssh.exec_command("reboot")
-                print(f"\n{ip:<16} -> 🔄 Reboot solicitado")
+    deseado = {"ppp.1.mtu": str(mtu), "ppp.1.mru": str(mtu)}
+    antes = {clave: snapshot.get(clave) for clave in deseado} if snapshot is not None else {}
 
-    except Exception as e:
-        print(f"{ip:<16} -> ❌ Error corrigiendo MTU/MRU: {e}")
\ No newline at end of file
+    r = reconciliar(ssh, ip, snapshot, deseado, dry_run=dry_run)
+    estado = r["estado"]
+    if estado == "SIN_CAMBIOS" and snapshot is not None and len(snapshot.ausentes(deseado)) == len(deseado):
+        estado = "SIN_LINEAS"
+    reboot = estado == "APLICADO" and do_reboot
+    if reboot:
+        reboot_device(ssh, ip, dry_run=dry_run)
+    if estado == "ERROR":
+        logging.error(f"[{ip}] Error corrigiendo MTU/MRU (exit code {r['exit_code']}): {r['reporte']}")
+    else:
+        logging.info(f"[{ip}] MTU/MRU PPPoE: {estado} (antes {antes})")
+    return {"estado": estado, "antes": antes, "reporte": r["reporte"], "exit_code": r["exit_code"],
+            "reboot": reboot}
@@ -0,0 +1,119 @@
+import json
+import logging
+import os
+from datetime import datetime
+
+# Diario append-only de un trabajo (una acción del menú sobre una lista de hosts).
+# La primera línea es la cabecera con la firma del trabajo (acción y datos que
+# cambian su efecto); luego una línea por host con su estado final, escrita y
+# sincronizada a disco (fsync) apenas el host termina. Si el proceso se corta,
+# el diario dice qué hosts ya quedaron hechos y el trabajo se puede reanudar
+# procesando sólo los pendientes y los fallidos.
+
+
+def _normalizar(firma):
+    """La firma tal como queda al releerla del JSON, para poder compararlas."""
+    return json.loads(json.dumps(firma, ensure_ascii=False, sort_keys=True))
+
+
+class EstadoDiario:
+    """Lo leído de un diario: cabecera, último estado por IP y si el trabajo terminó."""
+    def __init__(self, cabecera, estados, terminado):
+        self.cabecera = cabecera
+        self.estados = estados       # ip -> nombre del Estado (el último registrado)
+        self.terminado = terminado
+
+    def coincide(self, firma):
+        return self.cabecera.get("firma") == _normalizar(firma)
+
+    def hechos(self, estados_fallidos):
+        """IPs con un estado final que no está entre 'estados_fallidos' (nombres de Estado)."""
+        return {ip for ip, estado in self.estados.items() if estado not in estados_fallidos}
+
+
+def leer_diario(ruta):
+    """
+    Lee el diario de 'ruta'. Retorna None si no existe o no tiene cabecera.
+    Las líneas que no se pueden parsear (la última, si el corte fue a mitad
+    de una escritura) se ignoran.
+    """
+    if not os.path.exists(ruta):
+        return None
+    cabecera, estados, terminado = None, {}, False
+    with open(ruta, encoding="utf-8") as f:
+        for linea in f:
+            try:
+                registro = json.loads(linea)
+            except ValueError:
+                logging.warning(f"Línea inválida en el diario {ruta}, se ignora.")
+                continue
+            tipo = registro.get("tipo")
+            if tipo == "inicio":
+                if cabecera is None:
+                    cabecera = registro
+            elif tipo == "fin":
+                terminado = True
+            elif "ip" in registro:
+                estados[registro["ip"]] = registro["estado"]
+                terminado = False
+    if cabecera is None:
+        return None
+    return EstadoDiario(cabecera, estados, terminado)
+
+
+class DiarioTrabajo:
+    """
+    Escritor del diario de un trabajo. Con reanudar=False se crea de nuevo
+    (cabecera con 'firma' y 'descripcion'); con reanudar=True se agregan
+    líneas al diario existente. registrar() debe llamarse desde un único
+    hilo (el al_completar de _ejecutar_accion).
+    """
+    def __init__(self, ruta, firma, descripcion="", reanudar=False):
+        self.ruta = ruta
+        truncado = reanudar and self._termina_truncado(ruta)
+        self._archivo = open(ruta, "a" if reanudar else "w", encoding="utf-8")
+        if truncado:
+            self._archivo.write("\n")  # la línea cortada queda sola y se ignora al leer
+        if reanudar:
+            self._escribir({"tipo": "reanudado", "fecha": self._fecha()})
+        else:
+            self._escribir({"tipo": "inicio", "firma": _normalizar(firma), "descripcion": descripcion,
+                            "fecha": self._fecha()})
+
+    @staticmethod
+    def _termina_truncado(ruta):
+        """True si el archivo no termina en salto de línea (corte a mitad de una escritura)."""
+        with open(ruta, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() == 0:
+                return False
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) != b"\n"
+
+    @staticmethod
+    def _fecha():
+        return datetime.now().isoformat(timespec="seconds")
+
+    def _escribir(self, registro):
+        # Una línea completa por write y fsync: un corte deja a lo sumo la última línea truncada
+        self._archivo.write(json.dumps(registro, ensure_ascii=False) + "\n")
+        self._archivo.flush()
+        os.fsync(self._archivo.fileno())
+
+    def registrar(self, resultado):
+        """Estado final de un host (resultados.Resultado)."""
+        self._escribir({"ip": resultado.ip, "estado": resultado.estado.name, "detalle": resultado.detalle,
+                        "fecha": self._fecha()})
+
+    def terminar(self):
+        """Marca que el trabajo recorrió todos sus hosts (haya o no fallidos)."""
+        self._escribir({"tipo": "fin", "fecha": self._fecha()})
+
+    def cerrar(self):
+        self._archivo.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
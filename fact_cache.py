@@ -0,0 +1,127 @@
+import json
+import logging
+import os
+import threading
+import time
+
+
+class CacheHechos:
+    """
+    Cache en memoria (opcionalmente persistida en JSON) de lo último que se
+    supo de cada IP: si respondía y qué countrycode tenía (la credencial
+    que funcionó la guarda config_functions.CredentialCache). Cada hecho vence 'ttl' segundos después de registrado,
+    así una actualización hecha poco después de una consulta no repite el
+    sondeo ni el grep sobre los mismos equipos.
+    Con anotar_cambios=True (procesos hijos del motor "procesos") se anota
+    cada registro e invalidación para devolverlos al proceso principal con
+    extraer_cambios(); allí se aplican con fusionar().
+    """
+    CAMPOS = ("vida", "countrycode")
+
+    def __init__(self, ttl=300, ruta=None, anotar_cambios=False):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._datos = {}   # ip -> {campo: (instante, valor)}
+        self._cambios = {} if anotar_cambios else None   # (ip, campo) -> (instante, valor) o None
+        self.persistir_en(ruta)
+
+    def persistir_en(self, ruta):
+        """
+        Cambia el archivo donde guardar() persiste los hechos (None: sólo en
+        memoria) y carga los que ya tenga ese archivo.
+        """
+        self.ruta = ruta
+        if not ruta or not os.path.exists(ruta):
+            return
+        try:
+            with open(ruta, "r", encoding="utf-8") as f:
+                self.importar(json.load(f))
+        except Exception as e:
+            logging.error(f"No se pudo leer la cache de hechos {ruta}: {e}")
+
+    def _registrar(self, ip, campo, valor):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            dato = (time.time(), valor)
+            self._datos.setdefault(ip, {})[campo] = dato
+            if self._cambios is not None:
+                self._cambios[(ip, campo)] = dato
+
+    def _vigente(self, ip, campo):
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            dato = self._datos.get(ip, {}).get(campo)
+        if dato is None or time.time() - dato[0] > self.ttl:
+            return None
+        return dato[1]
+
+    def registrar_vida(self, ip, vivo, detalle=None):
+        """detalle: resultado a informar si no responde (Resultado.a_dict() del pre-chequeo)."""
+        self._registrar(ip, "vida", {"vivo": vivo, "detalle": detalle})
+
+    def vida(self, ip):
+        """Retorna {"vivo": bool, "detalle": str} vigente o None."""
+        return self._vigente(ip, "vida")
+
+    def registrar_countrycode(self, ip, valores):
+        self._registrar(ip, "countrycode", dict(valores))
+
+    def countrycode(self, ip):
+        """Retorna el último dict de check_country_mode vigente o None."""
+        return self._vigente(ip, "countrycode")
+
+    def invalidar(self, ip, campo=None):
+        with self._lock:
+            if campo is None:
+                self._datos.pop(ip, None)
+            else:
+                self._datos.get(ip, {}).pop(campo, None)
+            if self._cambios is not None:
+                for c in (self.CAMPOS if campo is None else (campo,)):
+                    self._cambios[(ip, c)] = None
+
+    def exportar(self):
+        """Hechos vigentes como {ip: {campo: [instante, valor]}} (lo que se persiste)."""
+        ahora = time.time()
+        with self._lock:
+            vigentes = {ip: {c: v for c, v in campos.items() if ahora - v[0] <= self.ttl}
+                        for ip, campos in self._datos.items()}
+        return {ip: campos for ip, campos in vigentes.items() if campos}
+
+    def importar(self, datos):
+        """Carga hechos exportados por otra instancia (p. ej. el proceso principal)."""
+        with self._lock:
+            for ip, campos in datos.items():
+                self._datos.setdefault(ip, {}).update({c: tuple(v) for c, v in campos.items()})
+
+    def extraer_cambios(self):
+        """Registros e invalidaciones anotados desde la última llamada."""
+        with self._lock:
+            cambios = self._cambios or {}
+            if self._cambios is not None:
+                self._cambios = {}
+        return cambios
+
+    def fusionar(self, cambios):
+        """Aplica los cambios extraídos de otra instancia, en el orden en que ocurrieron."""
+        with self._lock:
+            for (ip, campo), dato in cambios.items():
+                if dato is None:
+                    self._datos.get(ip, {}).pop(campo, None)
+                else:
+                    self._datos.setdefault(ip, {})[campo] = dato
+
+    def guardar(self):
+        """Persiste los hechos vigentes si la cache tiene ruta."""
+        if not self.ruta:
+            return
+        vigentes = self.exportar()
+        tmp = f"{self.ruta}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(vigentes, f)
+            os.replace(tmp, self.ruta)
+        except Exception as e:
+            logging.error(f"No se pudo guardar la cache de hechos {self.ruta}: {e}")
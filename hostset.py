@@ -0,0 +1,92 @@
+import bisect
+import ipaddress
+
+# Conjunto de hosts compacto para redes grandes.
+# Las IPv4 se guardan como rangos de enteros [inicio, fin] ordenados y sin
+# solapamientos (una /16 ocupa un solo rango en lugar de 65k strings) y se
+# expanden recién al iterar. Los nombres que no son IPv4 se guardan aparte.
+
+
+class ConjuntoHosts:
+    """
+    Hosts sin duplicados, iterados en orden (primero las IPv4 por rango y
+    luego los nombres). Acepta IPs sueltas, CIDR (como network.hosts(): sin
+    red ni broadcast salvo en /31 y /32) y nombres de host.
+    """
+
+    def __init__(self, tokens=()):
+        self._rangos = []       # [(inicio, fin)] inclusive, ordenados y fusionados
+        self._nombres = {}      # nombre -> None (dict para conservar el orden)
+        for token in tokens:
+            self.agregar(token)
+
+    def agregar(self, token):
+        """Agrega una IP, un CIDR o un nombre. ValueError si el CIDR es inválido."""
+        token = token.strip()
+        if "/" in token:
+            red = ipaddress.ip_network(token, strict=False)
+            if red.version != 4:
+                raise ValueError(f"sólo se admiten redes IPv4: {token}")
+            inicio, fin = int(red.network_address), int(red.broadcast_address)
+            if red.prefixlen < 31:
+                inicio, fin = inicio + 1, fin - 1
+            self._agregar_rango(inicio, fin)
+            return
+        try:
+            n = int(ipaddress.IPv4Address(token))
+        except ValueError:
+            self._nombres[token] = None
+            return
+        self._agregar_rango(n, n)
+
+    def _agregar_rango(self, inicio, fin):
+        # Se fusiona con los rangos que se solapan o son contiguos
+        i = bisect.bisect_left(self._rangos, (inicio,))
+        if i > 0 and self._rangos[i - 1][1] >= inicio - 1:
+            i -= 1
+        j = i
+        while j < len(self._rangos) and self._rangos[j][0] <= fin + 1:
+            inicio = min(inicio, self._rangos[j][0])
+            fin = max(fin, self._rangos[j][1])
+            j += 1
+        self._rangos[i:j] = [(inicio, fin)]
+
+    def __len__(self):
+        return sum(fin - inicio + 1 for inicio, fin in self._rangos) + len(self._nombres)
+
+    def __bool__(self):
+        return bool(self._rangos or self._nombres)
+
+    def __iter__(self):
+        for inicio, fin in self._rangos:
+            for n in range(inicio, fin + 1):
+                yield str(ipaddress.IPv4Address(n))
+        yield from self._nombres
+
+    def __contains__(self, host):
+        try:
+            n = int(ipaddress.IPv4Address(host))
+        except ValueError:
+            return host in self._nombres
+        i = bisect.bisect_right(self._rangos, (n, float("inf")))
+        return i > 0 and self._rangos[i - 1][1] >= n
+
+    def rangos(self):
+        """Rangos IPv4 como texto ('a.b.c.d' o 'a.b.c.d-e.f.g.h')."""
+        for inicio, fin in self._rangos:
+            a = ipaddress.IPv4Address(inicio)
+            yield str(a) if inicio == fin else f"{a}-{ipaddress.IPv4Address(fin)}"
+
+    def resumen(self, max_rangos=5):
+        """Texto corto para logs y menú: cantidad de hosts, rangos y nombres (los primeros 'max_rangos')."""
+        if not self:
+            return "(sin hosts)"
+        partes = list(self.rangos()) + list(self._nombres)
+        texto = ", ".join(partes[:max_rangos])
+        if len(partes) > max_rangos:
+            texto += f", ... (+{len(partes) - max_rangos})"
+        return f"{len(self)} hosts en {len(self._rangos)} rangos" + \
+            (f" y {len(self._nombres)} nombres" if self._nombres else "") + f": {texto}"
+
+    def __str__(self):
+        return self.resumen()
@@ -1,36 +1,34 @@
 import os
 import logging
-import concurrent.futures
-import ipaddress
+import functools
+import multiprocessing
+import time
 import csv
+import threading
+import socket
 import json
 from config_functions import *
 from utils import *
+from async_engine import ejecutar_async
+from sharding import ejecutar_en_procesos
+from pipeline import ejecutar_en_etapas
+from concurrency import ControladorAIMD
+from probes import barrer_icmp, sondear_tcp
+from fact_cache import CacheHechos
+from system_cfg import SnapshotStore
+from resultados import Resultado, Estado, ESTADOS_FALLIDOS, estado_countrycode
+from diario import DiarioTrabajo, leer_diario
+from hostset import ConjuntoHosts
 
-# Crear carpeta logs si no existe
-os.makedirs("logs", exist_ok=True)
+logger = logging.getLogger()
+console_handler = None
+file_handler = None
 
-# Crear archivo ip_list.csv de ejemplo si no existe
-if not os.path.exists("ip_list.csv"):
-    with open("ip_list.csv", "w", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=["IP"])
-        writer.writeheader()
-        writer.writerow({"IP": "192.168.1.1"})  # fila de ejemplo
+# Resultados por equipo: sólo al archivo de log (en consola los muestra EscritorConsola)
+logger_resultados = logging.getLogger("resultados")
+logger_resultados.propagate = False
 
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.INFO)
-console_formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
-console_handler.setFormatter(console_formatter)
-file_handler = logging.FileHandler("logs/mi_log.log", mode="a")
-file_handler.setLevel(logging.INFO)
-file_formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
-file_handler.setFormatter(file_formatter)
-logger.addHandler(console_handler)
-logger.addHandler(file_handler)
-
-hosts = []
+hosts = ConjuntoHosts()   # rangos compactos, se expanden al iterar
 username = None
 ultimo_username = None
 password = None
@@ -40,17 +38,87 @@ new_code = "511"
 do_reboot = False
 dry_run = False
 max_workers = 10
+motor = "hilos"        # "hilos" (ThreadPoolExecutor), "asyncio" o "procesos"
+max_en_vuelo = 1000    # equipos simultáneos en el motor asyncio
+tareas_por_worker = 4  # motor hilos/procesos: tareas enviadas por hilo (o lotes por proceso) a la vez
+hilos_vida = 4         # motor hilos: hilos de la etapa de vida (cada uno sondea lotes de hosts)
+etapas = None          # throughput por etapa de la última acción con el motor hilos
+procesos = os.cpu_count() or 1  # procesos del motor "procesos" (cada uno con max_workers hilos)
+concurrencia_adaptativa = False  # max_workers = "auto": límite AIMD entre 1 y max_workers_auto
+max_workers_auto = 200
+controlador = None     # ControladorAIMD de la acción en curso (si es adaptativa)
+modo_vivo = "icmp"     # pre-chequeo de vida: "icmp", "tcp" (puerto 22) o "icmp+tcp"
+timeout_tcp = 1.0      # timeout del sondeo TCP/22 (s)
+pps_icmp = 10000       # tasa total de envío ICMP (paquetes/s), repartida entre los sondeos simultáneos
+usar_shell = False     # True: comandos por una shell persistente (invoke_shell) por equipo
 mtu_objetivo = 1492
+timeout_comando = 30   # plazo de cada comando remoto (s); vencido se aborta el canal
+plazo_equipo = 120     # plazo de toda la etapa SSH de un equipo (s); 0 = sin plazo
+
+# Pool de sesiones SSH compartido entre acciones del menú
+pool_max_size = 1024
+pool_idle_timeout = 300
+ssh_pool = None
+
+# Credencial aprendida por IP (índice en [password] + alt_passwords)
+cred_cache = None
+
+# Hechos por IP (vida, countrycode) compartidos entre acciones del menú
+hechos_ttl = 300          # segundos; 0 desactiva la cache
+hechos_persistir = False  # True: se guardan en fact_cache.json entre ejecuciones
+hechos = None
+snapshots = None          # system.cfg leído una vez por equipo, con el mismo TTL
+
+# El pool y las caches se crean en inicializar() (proceso principal) o en
+# _inicializar_proceso() (hijos del motor "procesos"): los hijos se crean con
+# 'spawn' y reimportan este módulo, así que aquí no debe haber efectos.
+
+
+def _configurar_logging(consola=True):
+    """Log a logs/mi_log.log y, en el proceso principal, también a consola."""
+    global console_handler, file_handler
+    os.makedirs("logs", exist_ok=True)
+    formato = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
+    logger.setLevel(logging.INFO)
+    file_handler = logging.FileHandler("logs/mi_log.log", mode="a")
+    file_handler.setLevel(logging.INFO)
+    file_handler.setFormatter(formato)
+    logger.addHandler(file_handler)
+    logger_resultados.addHandler(file_handler)
+    if consola:
+        console_handler = logging.StreamHandler()
+        console_handler.setLevel(logging.INFO)
+        console_handler.setFormatter(formato)
+        logger.addHandler(console_handler)
+
+
+def inicializar():
+    """Efectos del proceso principal: logs, ip_list.csv de ejemplo, pool SSH y caches."""
+    global ssh_pool, cred_cache, hechos, snapshots
+    _configurar_logging()
+
+    # Crear archivo ip_list.csv de ejemplo si no existe
+    if not os.path.exists("ip_list.csv"):
+        with open("ip_list.csv", "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=["IP"])
+            writer.writeheader()
+            writer.writerow({"IP": "192.168.1.1"})  # fila de ejemplo
+
+    ssh_pool = SSHSessionPool(max_size=pool_max_size, idle_timeout=pool_idle_timeout)
+    cred_cache = CredentialCache("cred_cache.json")
+    hechos = CacheHechos(ttl=hechos_ttl, ruta="fact_cache.json" if hechos_persistir else None)
+    snapshots = SnapshotStore(ttl=hechos_ttl)
 
 def input_data():
-    global hosts, username, password, alt_password, old_code, new_code, do_reboot, dry_run, max_workers
+    global hosts, username, password, alt_password, old_code, new_code, do_reboot, dry_run, max_workers, motor, procesos
+    global concurrencia_adaptativa, modo_vivo, usar_shell, timeout_comando, plazo_equipo, hechos_ttl, hechos_persistir
 
     print("\n--- Ingresar/Editar datos ---")
     ips_input = input("Ingresa IPs manualmente o escribe csv:nombre_archivo.csv (default: csv:ip_list.csv): ").strip()
     if not ips_input:
         ips_input = "csv:ip_list.csv"
 
-    ip_list = []
+    ip_list = ConjuntoHosts()
     if ips_input.lower().startswith("csv:"):
         csv_file = ips_input[4:]
         try:
@@ -61,11 +129,7 @@ def input_data():
                     if ip:
                         token = ip.strip()
                         try:
-                            if "/" in token:
-                                network = ipaddress.ip_network(token, strict=False)
-                                ip_list.extend([str(ip) for ip in network.hosts()])
-                            else:
-                                ip_list.append(token)
+                            ip_list.agregar(token)
                         except Exception as e:
                             print(f"IP inválida '{token}', se omite. Error: {e}")
             print(f"Cargadas {len(ip_list)} IPs desde {csv_file}")
@@ -77,16 +141,11 @@ def input_data():
         ip_tokens = [x.strip() for x in ips_input.split(",") if x.strip()]
         for token in ip_tokens:
             try:
-                if "/" in token:
-                    network = ipaddress.ip_network(token, strict=False)
-                    ip_list.extend([str(ip) for ip in network.hosts()])
-                else:
-                    ip_list.append(token)
+                ip_list.agregar(token)
             except Exception as e:
                 print(f"Token inválido '{token}', se omite. Error: {e}")
 
-    hosts.clear()
-    hosts.extend(ip_list)
+    hosts = ip_list
 
     # Leer archivo JSON
     try:
@@ -130,42 +189,460 @@ def input_data():
     do_reboot = True if reboot_input == "s" else False
     dry_run_input = input("¿Deseas ejecutar en modo dry-run? (s/n) [n]: ").strip().lower()
     dry_run = True if dry_run_input == "s" else False
-    mw_input = input(f"Número máximo de hilos (default {max_workers}): ").strip()
+    actual_mw = "auto" if concurrencia_adaptativa else max_workers
+    mw_input = input(f"Número máximo de hilos o 'auto' para ajuste adaptativo (default {actual_mw}): ").strip().lower()
     if mw_input.isdigit():
         max_workers = int(mw_input)
+        concurrencia_adaptativa = False
+    elif mw_input == "auto":
+        concurrencia_adaptativa = True
+    motor_input = input(f"Motor de ejecución: (h)ilos, (a)syncio o (p)rocesos (default {motor}): ").strip().lower()
+    if motor_input.startswith("a"):
+        motor = "asyncio"
+    elif motor_input.startswith("p"):
+        motor = "procesos"
+    elif motor_input.startswith("h"):
+        motor = "hilos"
+    vivo_input = input(f"Pre-chequeo de vida: (i)cmp, (t)cp/22 o (a)mbos (default {modo_vivo}): ").strip().lower()
+    if vivo_input.startswith("i"):
+        modo_vivo = "icmp"
+    elif vivo_input.startswith("t"):
+        modo_vivo = "tcp"
+    elif vivo_input.startswith("a"):
+        modo_vivo = "icmp+tcp"
+    shell_input = input(f"¿Enviar los comandos por una shell persistente por equipo? (s/n) [{'s' if usar_shell else 'n'}]: ").strip().lower()
+    if shell_input in ("s", "n"):
+        usar_shell = shell_input == "s"
+    timeout_input = input(f"Plazo máximo por comando remoto en segundos (default {timeout_comando}): ").strip()
+    if timeout_input.isdigit() and int(timeout_input) > 0:
+        timeout_comando = int(timeout_input)
+    plazo_input = input(f"Plazo máximo por equipo en segundos, 0 = sin plazo (default {plazo_equipo}): ").strip()
+    if plazo_input.isdigit():
+        plazo_equipo = int(plazo_input)
+    ttl_input = input(f"TTL de la cache de hechos en segundos, 0 = desactivada (default {hechos.ttl}): ").strip()
+    if ttl_input.isdigit():
+        hechos_ttl = int(ttl_input)
+        hechos.ttl = hechos_ttl
+        snapshots.ttl = hechos_ttl
+    persistir_input = input(f"¿Guardar la cache de hechos en fact_cache.json entre ejecuciones? (s/n) "
+                            f"[{'s' if hechos_persistir else 'n'}]: ").strip().lower()
+    if persistir_input in ("s", "n"):
+        hechos_persistir = persistir_input == "s"
+        hechos.persistir_en("fact_cache.json" if hechos_persistir else None)
+    if motor == "procesos":
+        pr_input = input(f"Número de procesos, cada uno con {max_workers} hilos (default {procesos}): ").strip()
+        if pr_input.isdigit() and int(pr_input) > 0:
+            procesos = int(pr_input)
 
     print("\n✅ Datos guardados correctamente.\n")
     #logging.info("🔐 Usuario: %s | Tipo: %s | Password: %s | Alt: %s", username, tipo_clave, password, alt_password)   # Se quito porque en consola estos iconos dan problema
     logging.info(" -->  Usuario: %s | Tipo: %s | Password: %s | Alt: %s \n", username, tipo_clave, password, alt_password)
-    logging.info(" -->  Datos actualizados: old_code=%s, new_code=%s, do_reboot=%s, dry_run=%s, max_workers=%s\n", old_code, new_code, do_reboot, dry_run, max_workers)
+    logging.info(" -->  Datos actualizados: old_code=%s, new_code=%s, do_reboot=%s, dry_run=%s, max_workers=%s, adaptativa=%s, motor=%s, procesos=%s, vivo=%s\n", old_code, new_code, do_reboot, dry_run, max_workers, concurrencia_adaptativa, motor, procesos, modo_vivo)
     logging.info(" -->  Host a Verificar:\n")
-    logging.info("hosts=%s", hosts)
+    logging.info("hosts=%s", hosts.resumen(max_rangos=20))
     
     presionar_tecla()
     limpiar_pantalla()
 
 
-def check_one_device_mode(ip):
-    if not ping_host(ip):
-        return f"{ip}: No responde ping"
-    ssh = connect_device(ip, username, password, dry_run=dry_run, alt_password=alt_password)
+def imprimir_stats_pool():
+    global etapas
+    stats = ssh_pool.stats()
+    msg = f"Pool SSH: {stats['hits']} reutilizadas (hits) | {stats['misses']} nuevas (misses) | {stats['abiertas']} abiertas"
+    print(f"\n🔌 {msg}")
+    logging.info(msg)
+    if etapas is not None:
+        vida, ssh = etapas["vida"], etapas["ssh"]
+        msg = (f"Etapa vida: {vida['hosts']} hosts en {vida['segundos']:.1f}s "
+               f"({vida['hosts'] / max(vida['segundos'], 0.001):.0f} hosts/s), {vida['vivos']} vivos, "
+               f"{vida['espera']:.1f}s esperando a SSH | "
+               f"Etapa SSH: {ssh['equipos']} equipos en {ssh['segundos']:.1f}s "
+               f"({ssh['equipos'] / max(ssh['segundos'], 0.001):.1f} equipos/s)")
+        print(f"📶 {msg}")
+        logging.info(msg)
+        etapas = None
+
+
+def _sin_ping(ip):
+    return Resultado(ip, Estado.SIN_PING, "No responde ping")
+
+
+def _sin_ssh(ip, responde_ping=False):
+    extra = ", sí responde ping" if responde_ping else ""
+    return Resultado(ip, Estado.SIN_SSH, f"No responde SSH (TCP/22){extra}")
+
+
+def _error_motor(ip, e, contexto="Error"):
+    """Resultado de una etapa que terminó en excepción: TIMEOUT si se venció un plazo del canal."""
+    if isinstance(e, (TimeoutRemoto, socket.timeout)):
+        return Resultado(ip, Estado.TIMEOUT, f"Timeout - {e or 'el canal no respondió'}")
+    return Resultado(ip, Estado.ERROR, f"{contexto} - {e}")
+
+
+def _sondear(ips, pps=None):
+    """
+    Sondeo en lote según modo_vivo. Retorna {"icmp": {...}, "tcp": {...}} con las claves que apliquen.
+    pps: tasa ICMP de este sondeo (por defecto toda pps_icmp).
+    """
+    resultado = {}
+    if modo_vivo in ("icmp", "icmp+tcp"):
+        resultado["icmp"] = barrer_icmp(ips, pps=pps or pps_icmp)
+    if modo_vivo in ("tcp", "icmp+tcp"):
+        resultado["tcp"] = sondear_tcp(ips, puerto=22, timeout=timeout_tcp)
+    return resultado
+
+
+def _vida_resuelta(vida):
+    """True si el hecho de vida de la cache alcanza para decidir sin sondear."""
+    return vida is not None and (vida["vivo"] or isinstance(vida["detalle"], dict))
+
+
+def _pre_chequeo(ip, datos, vida=None):
+    """
+    Pre-chequeo de vida antes de conectar por SSH, según modo_vivo.
+    Si 'vida' es un hecho vigente de la cache (leído por _etapa_vida) responde
+    con él; si no, clasifica al host con 'datos', el sondeo del lote en curso,
+    que debe incluirlo (ya no se sondea un host suelto: bloquearía la etapa).
+    Retorna None si se puede conectar, o el resultado a informar:
+    - icmp: no responde ping.
+    - tcp: el puerto 22 no acepta conexiones.
+    - icmp+tcp: se conecta si el puerto 22 responde (aunque filtre ICMP);
+      si sólo responde ping, el sshd está caído o colgado.
+    """
+    if _vida_resuelta(vida):
+        if vida["vivo"]:
+            return None
+        fallo = Resultado.desde_dict(vida["detalle"])
+        return fallo._replace(detalle=f"{fallo.detalle} (cache)")
+    if not (datos and all(ip in r for r in datos.values())):
+        raise ValueError(f"{ip}: el sondeo del lote no incluye al host")
+    icmp = datos["icmp"][ip].vivo if "icmp" in datos else None
+    tcp = datos["tcp"][ip].vivo if "tcp" in datos else None
+    if modo_vivo == "icmp":
+        fallo = None if icmp else _sin_ping(ip)
+    elif tcp:
+        fallo = None
+    elif modo_vivo == "icmp+tcp" and not icmp:
+        fallo = _sin_ping(ip)
+    else:
+        fallo = _sin_ssh(ip, responde_ping=bool(icmp))
+    if not dry_run:
+        hechos.registrar_vida(ip, fallo is None, fallo.a_dict() if fallo else None)
+    return fallo
+
+
+def _etapa_vida(lote, usar_cache=False, pps=None):
+    """
+    Etapa de vida de los motores: un único sondeo para el lote. Retorna [(ip, fallo)].
+    La cache se lee una sola vez por host y esa lectura decide: si un hecho
+    vence entre la lectura y la clasificación, el host no se sondea aparte
+    (un sondeo de un solo host bloquearía la etapa ~1 s por host).
+    """
+    cacheados = {}
+    if usar_cache:
+        for ip in lote:
+            vida = hechos.vida(ip)
+            if _vida_resuelta(vida):
+                cacheados[ip] = vida
+    a_sondear = [ip for ip in lote if ip not in cacheados]
+    datos = _sondear(a_sondear, pps=pps) if a_sondear else None
+    return [(ip, _pre_chequeo(ip, datos=datos, vida=cacheados.get(ip))) for ip in lote]
+
+
+def _ejecutor(ssh):
+    """
+    Con usar_shell, los comandos del equipo se envían por una ShellPersistente
+    (un solo canal invoke_shell) en lugar de abrir un canal por exec_command.
+    """
+    if usar_shell and not dry_run:
+        return ShellPersistente(ssh)
+    return ssh
+
+
+def _cerrar_ejecutor(ejecutor, ssh):
+    if ejecutor is not ssh:
+        ejecutor.close()
+
+
+# Tiempo de conexión de la etapa SSH en curso en cada hilo (lo completa _conectar)
+_tiempos = threading.local()
+
+
+def _cronometrado(fn):
+    """Completa en el Resultado de una etapa SSH t_conexion_ms (medido en _conectar) y t_total_ms."""
+    @functools.wraps(fn)
+    def envuelta(ip, *args, **kwargs):
+        _tiempos.conexion_ms = None
+        inicio = time.monotonic()
+        resultado = fn(ip, *args, **kwargs)
+        return resultado._replace(t_conexion_ms=_tiempos.conexion_ms,
+                                  t_total_ms=round((time.monotonic() - inicio) * 1000, 1))
+    return envuelta
+
+
+def _conectar(ip):
+    """
+    Obtiene una sesión del pool y, si la concurrencia es adaptativa, informa
+    al controlador la latencia del handshake o si terminó en timeout (connect
+    o banner; un rechazo rápido no cuenta como timeout). Las sesiones
+    reutilizadas del pool y las de dry-run no hicieron handshake y no se informan.
+    """
+    inicio = time.monotonic()
+    ssh = ssh_pool.acquire(ip, username, password, dry_run=dry_run, alt_password=alt_password,
+                           cred_cache=cred_cache)
+    _tiempos.conexion_ms = round((time.monotonic() - inicio) * 1000, 1)
+    if controlador is not None and not dry_run and not sesion_reutilizada():
+        if ssh is not None:
+            controlador.registrar(True, time.monotonic() - inicio)
+        else:
+            controlador.registrar(False, timeout=ultimo_error_conexion() in (ERROR_BANNER, ERROR_TIMEOUT))
+    if ssh is not None and not dry_run:
+        # El plazo del equipo corre desde que se obtuvo la sesión
+        ssh.fijar_plazos(timeout_comando, plazo_equipo)
+    return ssh
+
+
+def _mostrar_concurrencia(limite, motivo):
+    # Por logging: durante la acción la consola la escribe EscritorConsola
+    logging.info(f"Concurrencia ajustada a {limite} hilos ({motivo})")
+
+
+def _resumen_concurrencia(ctrl):
+    niveles = [nivel for _, nivel in ctrl.historial]
+    inicio = ctrl.historial[0][0]
+    evolucion = " -> ".join(f"{nivel}@{t - inicio:.0f}s" for t, nivel in ctrl.historial)
+    msg = f"Concurrencia adaptativa: final {ctrl.limite}, mín {min(niveles)}, máx {max(niveles)} | {evolucion}"
+    logging.info(msg)
+
+
+def _config_actual():
+    """Datos de la acción que necesita un proceso hijo del motor "procesos"."""
+    return {
+        "username": username, "password": password, "alt_password": alt_password,
+        "old_code": old_code, "new_code": new_code, "do_reboot": do_reboot, "dry_run": dry_run,
+        "modo_vivo": modo_vivo, "usar_shell": usar_shell,
+        "timeout_comando": timeout_comando, "plazo_equipo": plazo_equipo, "hechos_ttl": hechos_ttl,
+    }
+
+
+def _inicializar_proceso(config, hechos_vigentes):
+    """
+    Inicializador de los procesos hijos: carga los datos ingresados y los hechos
+    vigentes del proceso principal, y crea el pool y las caches del proceso.
+    La cache de credenciales se lee pero no se escribe; credenciales y hechos
+    aprendidos vuelven al principal con cada lote (_aprendido_en_proceso).
+    Los snapshots de system.cfg quedan en el proceso hijo.
+    """
+    global ssh_pool, cred_cache, hechos, snapshots
+    globals().update(config)
+    _configurar_logging(consola=False)
+    ssh_pool = SSHSessionPool(max_size=pool_max_size, idle_timeout=pool_idle_timeout)
+    cred_cache = CredentialCache("cred_cache.json")
+    hechos = CacheHechos(ttl=hechos_ttl, anotar_cambios=True)
+    hechos.importar(hechos_vigentes)
+    snapshots = SnapshotStore(ttl=hechos_ttl)
+
+
+def _aprendido_en_proceso():
+    """Motor procesos (en el hijo): lo aprendido en el lote que el proceso principal debe conservar."""
+    return {"credenciales": cred_cache.extraer_cambios(), "hechos": hechos.extraer_cambios(),
+            "pool": ssh_pool.extraer_contadores()}
+
+
+def _fusionar_aprendido(aprendido):
+    """Motor procesos (en el principal): aplica lo que devolvió _aprendido_en_proceso."""
+    cred_cache.fusionar(aprendido["credenciales"])
+    hechos.fusionar(aprendido["hechos"])
+    ssh_pool.sumar_contadores(aprendido["pool"])
+
+
+def _ejecutar_accion(ssh_fn, usar_cache=False, al_completar=None, acumular=True, objetivos=None):
+    """
+    Corre la acción sobre 'objetivos' (por defecto todos los hosts) con el motor elegido en input_data.
+    - hilos: pipeline de dos etapas: hilos_vida hilos sondean lotes de hosts y los vivos pasan,
+      por una cola de tareas_por_worker x max_workers lugares, a max_workers hilos SSH (ssh_fn).
+      El throughput de cada etapa queda en 'etapas' para el resumen.
+    - asyncio: un event loop que sondea lotes de hosts en un hilo y pasa los vivos a ssh_fn
+      en un executor acotado.
+    - procesos: lotes de hosts repartidos entre 'procesos' procesos; cada proceso sondea su lote
+      y corre ssh_fn sobre los vivos con max_workers hilos.
+      Cada proceso tiene su propio pool SSH y sus snapshots de system.cfg, por eso no se reutilizan
+      luego; las credenciales, los hechos aprendidos y los hits/misses del pool sí vuelven al
+      proceso principal con cada lote.
+    Con concurrencia adaptativa (hilos/asyncio) la etapa SSH pasa por un ControladorAIMD.
+    En todos los motores la vida se sondea por lotes (_etapa_vida), nunca toda la lista de una vez;
+    con usar_cache=True no se sondean los hosts cuya vida ya está en la cache de hechos.
+    al_completar(resultado) se llama desde un único hilo a medida que terminan los equipos.
+    Con acumular=False los resultados sólo llegan a al_completar y se retorna una lista vacía,
+    para que la memoria no crezca con la cantidad de hosts.
+    """
+    global controlador, etapas
+    objetivos = hosts if objetivos is None else objetivos
+    # pps_icmp es la tasa total: se reparte entre los sondeos que corren a la vez
+    simultaneos = {"hilos": hilos_vida, "procesos": procesos}.get(motor, 1)
+    etapa_vida = functools.partial(_etapa_vida, usar_cache=usar_cache, pps=max(1, pps_icmp // simultaneos))
+    if motor == "procesos":
+        try:
+            return ejecutar_en_procesos(objetivos, ssh_fn, procesos, max_workers, etapa_vida=etapa_vida,
+                                        inicializador=_inicializar_proceso,
+                                        initargs=(_config_actual(), hechos.exportar()),
+                                        al_completar=al_completar, acumular=acumular,
+                                        lotes_por_proceso=tareas_por_worker,
+                                        recolectar=_aprendido_en_proceso, al_recolectar=_fusionar_aprendido)
+        finally:
+            hechos.guardar()
+            cred_cache.guardar()
+
+    workers = max_workers
+    if concurrencia_adaptativa:
+        # El executor se dimensiona al máximo y el controlador limita cuántos hilos hacen SSH a la vez
+        controlador = ControladorAIMD(inicial=min(max_workers, max_workers_auto), maximo=max_workers_auto,
+                                      al_cambiar=_mostrar_concurrencia)
+        ssh_fn = controlador.envolver(ssh_fn)
+        workers = max_workers_auto
+
+    try:
+        if motor == "asyncio":
+            return ejecutar_async(objetivos, etapa_vida, ssh_fn, max_workers=workers, max_en_vuelo=max_en_vuelo,
+                                  al_completar=al_completar, acumular=acumular, resultado_error=_error_motor)
+        actual_workers = max(1, min(workers, len(objetivos)))
+        resultados, etapas = ejecutar_en_etapas(
+            objetivos, etapa_vida, ssh_fn, hilos_ssh=actual_workers,
+            hilos_vida=hilos_vida, capacidad=tareas_por_worker * actual_workers, al_completar=al_completar,
+            acumular=acumular, resultado_error=_error_motor)
+        return resultados
+    finally:
+        hechos.guardar()
+        cred_cache.guardar()
+        if controlador is not None:
+            _resumen_concurrencia(controlador)
+            controlador = None
+
+
+@_cronometrado
+def _check_device_ssh(ip):
+    ssh = _conectar(ip)
     if ssh is None:
-        return f"{ip}: Conexión fallida para verificación"
+        return Resultado(ip, Estado.CONEXION_FALLIDA, f"Conexión fallida para verificación ({ultimo_error_conexion()})")
+    ejecutor = ssh
     try:
-        mode_dict = check_country_mode(ssh, ip, dry_run=dry_run)
-        values = set(mode_dict.values())
-        if len(values) == 1:
-            if "32" in values:
-                mode = "Argentina (32)"
-            elif "511" in values:
-                mode = "Licensed (511)"
-            else:
-                mode = f"Desconocido: {', '.join(values)}"
-        else:
+        ejecutor = _ejecutor(ssh)
+        # Un único cat de system.cfg; el countrycode se resuelve en memoria
+        mode_dict = snapshots.obtener(ejecutor, ip, dry_run=dry_run).countrycode()
+        if not dry_run:
+            hechos.registrar_countrycode(ip, mode_dict)
+        estado = estado_countrycode(mode_dict)
+        if estado == Estado.INCONSISTENTE:
             mode = "Valores inconsistentes: " + ", ".join(f"{k}={v}" for k, v in mode_dict.items())
-        return f"{ip}: Modo detectado -> {mode}"
+        elif estado == Estado.DESCONOCIDO:
+            mode = f"Desconocido: {', '.join(set(mode_dict.values()))}"
+        else:
+            mode = estado.value
+        return Resultado(ip, estado, f"Modo detectado -> {mode}", countrycode=mode_dict)
+    except Exception as e:
+        logging.error(f"{ip}: Error durante la verificación - {e}")
+        ssh_pool.discard(ssh)
+        return _error_motor(ip, e)
     finally:
-        ssh.close()
+        _cerrar_ejecutor(ejecutor, ssh)
+        ssh_pool.release(ssh)
+
+CATEGORIAS_VERIFICACION = [
+    (Estado.ARGENTINA, "🟥"),
+    (Estado.LICENSED, "🟩"),
+    (Estado.SIN_PING, "⚫"),
+    (Estado.SIN_SSH, "🔒"),
+    (Estado.CONEXION_FALLIDA, "❌"),
+    (Estado.ERROR, "❌"),
+    (Estado.TIMEOUT, "⏱️"),
+    (Estado.INCONSISTENTE, "⚠️"),
+    (Estado.DESCONOCIDO, "❓"),
+]
+
+
+def _ruta_resultados(accion):
+    """Archivo JSONL con un registro por host para la acción en curso."""
+    return os.path.join("logs", f"{accion}_{time.strftime('%Y%m%d_%H%M%S')}.jsonl")
+
+
+def _ruta_diario(accion):
+    """Diario del último trabajo de la acción (uno por acción, se reanuda o se reemplaza)."""
+    return os.path.join("logs", f"diario_{accion}.jsonl")
+
+
+def _firma_trabajo(accion, **datos):
+    """Identifica un trabajo: acción y datos que cambian su efecto. Sólo se reanuda un diario con la misma firma."""
+    return dict(accion=accion, usuario=username, dry_run=dry_run, do_reboot=do_reboot, **datos)
+
+
+def _pendientes_de_reanudar(accion, firma):
+    """
+    Si hay un diario previo del mismo trabajo con hosts ya hechos (estado
+    final no fallido), ofrece reanudarlo. Retorna los hosts que faltan
+    (pendientes y fallidos) o None para empezar un trabajo nuevo.
+    """
+    previo = leer_diario(_ruta_diario(accion))
+    if previo is None or not previo.coincide(firma):
+        return None
+    hechos_ok = {ip for ip in previo.hechos({estado.name for estado in ESTADOS_FALLIDOS}) if ip in hosts}
+    if not hechos_ok:
+        return None
+    situacion = "terminado con fallidos" if previo.terminado else "interrumpido"
+    defecto = "n" if previo.terminado else "s"
+    print(f"\n📒 Trabajo '{accion}' del {previo.cabecera['fecha']} {situacion}: "
+          f"{len(hechos_ok)} de {len(hosts)} hosts ya terminados.")
+    resp = input(f"¿Reanudar procesando sólo los pendientes y fallidos? (s/n) [{defecto}]: ").strip().lower() or defecto
+    if resp != "s":
+        return None
+    return ConjuntoHosts(ip for ip in hosts if ip not in hechos_ok)
+
+
+def _ejecutar_agregando(ssh_fn, categorias, accion, usar_cache=False, firma=None):
+    """
+    Corre la acción agregando cada Resultado apenas termina: contador por
+    estado y línea en vivo en consola, y registro por host en un JSONL bajo
+    logs/. No se acumulan los resultados en memoria.
+    Cada estado final se anota además en el diario del trabajo (logs/diario_<accion>.jsonl,
+    con fsync por host); si el diario previo tiene la misma firma se puede reanudar
+    procesando sólo los hosts pendientes y fallidos.
+    Retorna el AgregadorResultados (cerrado) para imprimir el resumen.
+    """
+    firma = firma or _firma_trabajo(accion)
+    objetivos = _pendientes_de_reanudar(accion, firma)
+    reanudar = objetivos is not None
+    if reanudar:
+        logging.info(f"Reanudando '{accion}': {len(objetivos)} hosts pendientes o fallidos de {len(hosts)}.")
+    else:
+        objetivos = hosts
+    with EscritorConsola() as escritor, log_por_escritor(escritor, logger, console_handler), AgregadorResultados(
+            _ruta_resultados(accion), categorias, escritor=escritor, total=len(objetivos)) as agregador, \
+            DiarioTrabajo(_ruta_diario(accion), firma, descripcion=hosts.resumen(), reanudar=reanudar) as diario:
+        def al_completar(resultado):
+            logger_resultados.info(resultado)
+            diario.registrar(resultado)
+            agregador.registrar(resultado)
+
+        escritor.progreso(f"[0/{len(objetivos)}] procesando...")
+        _ejecutar_accion(ssh_fn, usar_cache=usar_cache, al_completar=al_completar, acumular=False,
+                         objetivos=objetivos)
+        diario.terminar()
+    logging.info(f"Resultados por host en {agregador.ruta}")
+    if reanudar:
+        print(f"\n📒 Reanudado: se omitieron {len(hosts) - len(objetivos)} hosts ya terminados.")
+    return agregador
+
+
+def _imprimir_resumen(agregador, estados_detalle):
+    """Contadores de todos los estados y detalle (releído del JSONL) de los indicados."""
+    for estado, cantidad in agregador.conteo.items():
+        if cantidad:
+            print(f"{agregador.icono(estado)} {estado.value}: {cantidad}")
+    for estado in estados_detalle:
+        if agregador.conteo.get(estado):
+            print(f"\n🔸 {estado.value} ({agregador.conteo[estado]}):")
+            print_with_pagination(agregador.detalle(estado))
+    print(f"\n📄 Detalle por host: {agregador.ruta}")
+
 
 def check_device_mode_action():
     if not hosts or not username or not password:
@@ -174,83 +651,83 @@ def check_device_mode_action():
         limpiar_pantalla()
         return
     limpiar_pantalla()
-    resultados = []
-    actual_workers = min(max_workers, len(hosts))
-    with concurrent.futures.ThreadPoolExecutor(max_workers=actual_workers) as executor:
-        futures = {executor.submit(check_one_device_mode, ip): ip for ip in hosts}
-        for future in concurrent.futures.as_completed(futures):
-            resultado = future.result()
-            resultados.append(resultado)
-    
-    logging.info("\n === Resumen de verificación ===")
-    print("\n📋 Resumen de verificación por modo detectado:\n")
-
-    resumen = {
-        "Argentina (32)": [],
-        "Licensed (511)": [],
-        "No responde ping": [],
-        "Conexión fallida": [],
-        "Error": [],
-        "Inconsistente": [],
-        "Desconocido": []
-    }
+    logging.info("\n === Verificación de country code ===")
+    agregador = _ejecutar_agregando(_check_device_ssh, CATEGORIAS_VERIFICACION,
+                                    "verificacion")
 
-    for res in resultados:
-        logging.info(res)
-        if "Argentina (32)" in res:
-            resumen["Argentina (32)"].append("🟥 " + res)
-        elif "Licensed (511)" in res:
-            resumen["Licensed (511)"].append("🟩 " + res)
-        elif "No responde ping" in res:
-            resumen["No responde ping"].append("⚫ " + res)
-        elif "Conexión fallida" in res:
-            resumen["Conexión fallida"].append("❌ " + res)
-        elif "inconsistente" in res.lower():
-            resumen["Inconsistente"].append("⚠️ " + res)
-        elif "Error" in res:
-            resumen["Error"].append("❌ " + res)
-        else:
-            resumen["Desconocido"].append("❓ " + res)
-
-    for categoria, items in resumen.items():
-        if items:
-            print(f"\n🔸 {categoria} ({len(items)}):")
-            print_with_pagination(items)
+    print("\n📋 Resumen de verificación por modo detectado:\n")
+    _imprimir_resumen(agregador, [estado for estado, _ in CATEGORIAS_VERIFICACION])
 
+    imprimir_stats_pool()
     presionar_tecla()
     limpiar_pantalla()
 
-def update_one_device(ip):
-    if not ping_host(ip):
-        logging.error(f"{ip}: No responde ping; se omite.")
-        return f"{ip}: No responde ping"
 
-    ssh = connect_device(ip, username, password, dry_run=dry_run, alt_password=alt_password)
+@_cronometrado
+def _update_device_ssh(ip):
+    # Confirmado en new_code por una consulta reciente: no hace falta conectarse
+    cacheado = hechos.countrycode(ip)
+    if cacheado and set(cacheado.values()) == {new_code}:
+        logging.info(f"{ip}: Ya tiene el código de país {new_code} (cache), no se realizan cambios.")
+        return Resultado(ip, Estado.SIN_CAMBIOS, f"Ya tiene el código {new_code} (cache), no se actualiza ni reinicia.",
+                         countrycode=cacheado)
+
+    ssh = _conectar(ip)
     if ssh is None:
-        logging.error(f"{ip}: Error de conexión.")
-        return f"{ip}: Conexión fallida"
+        logging.error(f"{ip}: Error de conexión ({ultimo_error_conexion()}).")
+        return Resultado(ip, Estado.CONEXION_FALLIDA, f"Conexión fallida ({ultimo_error_conexion()})")
 
+    ejecutor = ssh
     try:
-        mode_dict = check_country_mode(ssh, ip, dry_run=dry_run)
-        values = set(mode_dict.values())
-
-        # ¿Ya tiene el código deseado?
-        if len(values) == 1 and new_code in values:
-            logging.info(f"{ip}: Ya tiene el código de país {new_code}, no se realizan cambios.")
-            return f"{ip}: Ya tiene el código {new_code}, no se actualiza ni reinicia."
-
-        # Caso contrario, actualizamos
-        update_config(ssh, ip, old_code, new_code, dry_run=dry_run)
-        verify_update(ssh, ip, dry_run=dry_run)
-        persist_changes(ssh, ip, dry_run=dry_run)
+        ejecutor = _ejecutor(ssh)
+        snapshot = None if dry_run else snapshots.cacheado(ip)
+        if snapshot is not None:
+            # system.cfg ya leído en esta ejecución: se decide localmente y sólo se envía el diff
+            plan = actualizar_country_code_snapshot(ejecutor, ip, snapshot, old_code, new_code)
+        else:
+            # Lectura, sed, verificación y cfgmtd en un único comando remoto
+            plan = actualizar_country_code_fusionado(ejecutor, ip, old_code, new_code, dry_run=dry_run)
+        confirmado = plan["despues"] if plan["estado"] == "ACTUALIZADO" and plan["despues"] else plan["antes"]
+        if not dry_run and plan["antes"] is not None:
+            hechos.registrar_countrycode(ip, confirmado)
+
+        if plan["estado"] == "SIN_CAMBIOS":
+            actuales = set((plan["antes"] or {}).values())
+            if not actuales or actuales == {new_code}:
+                logging.info(f"{ip}: Ya tiene el código de país {new_code}, no se realizan cambios.")
+                detalle = f"Ya tiene el código {new_code}, no se actualiza ni reinicia."
+            else:
+                logging.info(f"{ip}: Sin líneas en {old_code} ({', '.join(sorted(actuales))}), no se realizan cambios.")
+                detalle = f"No tiene el código {old_code} ({', '.join(sorted(actuales))}), no se actualiza ni reinicia."
+            return Resultado(ip, Estado.SIN_CAMBIOS, detalle, countrycode=plan["antes"])
+        if plan["estado"] != "ACTUALIZADO":
+            return Resultado(ip, Estado.ERROR, f"Error - sed exit {plan['sed']}, cfgmtd exit {plan['cfgmtd']}: {plan['error']}",
+                             countrycode=plan["antes"])
+
         if do_reboot:
-            reboot_device(ssh, ip, dry_run=dry_run)
-        return f"{ip}: Actualizado correctamente a {new_code}"
+            reboot_device(ejecutor, ip, dry_run=dry_run)
+            ssh_pool.discard(ssh)  # el equipo se reinicia, la sesión ya no sirve
+            hechos.invalidar(ip, "vida")
+            snapshots.invalidar(ip)
+        return Resultado(ip, Estado.ACTUALIZADO, f"Actualizado correctamente a {new_code}", countrycode=confirmado)
     except Exception as e:
         logging.error(f"{ip}: Error durante la actualización - {e}")
-        return f"{ip}: Error - {e}"
+        ssh_pool.discard(ssh)
+        return _error_motor(ip, e)
     finally:
-        ssh.close()
+        _cerrar_ejecutor(ejecutor, ssh)
+        ssh_pool.release(ssh)
+
+CATEGORIAS_ACTUALIZACION = [
+    (Estado.ACTUALIZADO, "🛠️"),
+    (Estado.SIN_CAMBIOS, "🟩"),
+    (Estado.ERROR, "❌"),
+    (Estado.TIMEOUT, "⏱️"),
+    (Estado.CONEXION_FALLIDA, "❌"),
+    (Estado.SIN_PING, "⚫"),
+    (Estado.SIN_SSH, "🔒"),
+]
+
 
 def update_country_code_action():
     if not hosts or not username or not password:
@@ -258,74 +735,99 @@ def update_country_code_action():
         presionar_tecla()
         limpiar_pantalla()
         return
-    resultados = []
-    actual_workers = min(max_workers, len(hosts))
-    with concurrent.futures.ThreadPoolExecutor(max_workers=actual_workers) as executor:
-        futures = {executor.submit(update_one_device, ip): ip for ip in hosts}
-        for future in concurrent.futures.as_completed(futures):
-            resultado = future.result()
-            resultados.append(resultado)
+    agregador = _ejecutar_agregando(_update_device_ssh, CATEGORIAS_ACTUALIZACION,
+                                    "actualizacion", usar_cache=True,
+                                    firma=_firma_trabajo("actualizacion", old_code=old_code, new_code=new_code))
 
     print("\n📋 Resumen de actualización:\n")
+    _imprimir_resumen(agregador, [Estado.ACTUALIZADO, Estado.ERROR, Estado.TIMEOUT, Estado.CONEXION_FALLIDA,
+                                  Estado.SIN_PING, Estado.SIN_SSH])
 
-    actualizados = []
-    errores = []
-    sin_respuesta = []
-
-    for res in resultados:
-        logging.info(res)
-        if "Actualizado correctamente" in res:
-            actualizados.append("🛠️ " + res)
-        elif "Conexión fallida" in res or "Error" in res:
-            errores.append("❌ " + res)
-        elif "No responde ping" in res:
-            sin_respuesta.append("⚫ " + res)
-
-    if actualizados:
-        limpiar_pantalla()
-        print(f"\n✅ Equipos actualizados correctamente ({len(actualizados)}):")
-        print_with_pagination(actualizados)
-    if errores:
-        print(f"\n❌ Errores detectados ({len(errores)}):")
-        print_with_pagination(errores)
-    if sin_respuesta:
-        print(f"\n⚫ Sin respuesta al ping ({len(sin_respuesta)}):")
-        print_with_pagination(sin_respuesta)
-
+    imprimir_stats_pool()
     presionar_tecla()
     limpiar_pantalla()
     
-def configurar_aps_estandar():
-    import json
-    from config_functions import connect_device, persist_changes, reboot_device
+CATEGORIAS_CONFIGURACION = [
+    (Estado.APLICADO, "✅"),
+    (Estado.SIN_CAMBIOS, "🟩"),
+    (Estado.ERROR, "❌"),
+    (Estado.TIMEOUT, "⏱️"),
+    (Estado.CONEXION_FALLIDA, "❌"),
+    (Estado.SIN_PING, "⚫"),
+    (Estado.SIN_SSH, "🔒"),
+]
 
-    global hosts, username, password, alt_password, dry_run, do_reboot
 
-    if not hosts or not username or not password:
-        print("\n[ERROR] Primero debes ingresar los datos (opción 1 en el menú).")
-        presionar_tecla()
-        limpiar_pantalla()
-        return
+@_cronometrado
+def _configurar_un_ap(ip, parametros):
+    """Aplica 'parametros' a un AP y retorna un Resultado. No escribe en consola."""
+    ssh = _conectar(ip)
+    if ssh is None:
+        resultado = Resultado(ip, Estado.CONEXION_FALLIDA, f"Conexión fallida ({ultimo_error_conexion()})")
+        logging.error(resultado)
+        return resultado
+
+    ejecutor = ssh
+    try:
+        ejecutor = _ejecutor(ssh)
+        # Se compara en memoria contra system.cfg; sólo las claves que difieren
+        # se envían, en un solo canal y con cfgmtd al final si hubo cambios
+        snapshot = None if dry_run else snapshots.obtener(ejecutor, ip)
+        r = reconciliar(ejecutor, ip, snapshot, parametros, dry_run=dry_run)
+        reporte = r["reporte"]
+        ausentes = [clave for clave, estado in reporte.items() if estado == "AUSENTE"]
+        fallidas = [clave for clave, estado in reporte.items() if estado == "FALLO"]
+        sin_cambio = [clave for clave, estado in reporte.items() if estado == "SIN_CAMBIO"]
+        detalle = f"{len(reporte) - len(ausentes) - len(fallidas) - len(sin_cambio)} OK"
+        if sin_cambio:
+            detalle += f", {len(sin_cambio)} sin cambio"
+        if ausentes:
+            detalle += f", ausentes: {', '.join(ausentes)}"
+
+        if r["estado"] == "ERROR":
+            resultado = Resultado(ip, Estado.ERROR, f"Error aplicando parámetros ({detalle}, fallidas: "
+                                  f"{', '.join(fallidas) or 'cfgmtd'}); no se guarda en flash", reporte=reporte)
+            logging.error(resultado)
+            return resultado
+
+        if r["estado"] == "SIN_CAMBIOS":
+            resultado = Resultado(ip, Estado.SIN_CAMBIOS, f"Ya tiene la configuración estándar ({detalle}), "
+                                  "no se escribe en flash ni se reinicia", reporte=reporte)
+            logging.info(resultado)
+            return resultado
+
+        if do_reboot and not dry_run:
+            reboot_device(ejecutor, ip, dry_run=False)
+            ssh_pool.discard(ssh)
+            snapshots.invalidar(ip)
+
+        resultado = Resultado(ip, Estado.APLICADO, f"Configuración aplicada ({detalle})", reporte=reporte)
+        logging.info(resultado)
+        return resultado
+    except Exception as e:
+        resultado = _error_motor(ip, e, "Error durante la configuración")
+        logging.error(resultado)
+        ssh_pool.discard(ssh)
+        return resultado
+    finally:
+        _cerrar_ejecutor(ejecutor, ssh)
+        ssh_pool.release(ssh)
+
+
+def _pedir_parametros_ap():
+    """Carga config_ap_ac.json y pide los ajustes por consola. Retorna el dict o None si no se pudo leer."""
     try:
         with open("config_ap_ac.json") as f:
             parametros = json.load(f)
     except Exception as e:
         print(f"[ERROR] No se pudo leer config_ap_ac.json: {e}")
         presionar_tecla()
-        return
+        return None
 
     # Cargo valores del JSON
     canalbw = parametros.get("radio.1.chanbw")
     potenciatx = parametros.get("radio.1.txpower")
     sensibilidadrx = parametros.get("radio.1.rx_sensitivity")
-    
-
-    print("\n--- Configuración personalizada (Enter para usar valores por defecto) ---")
-
-    # Usuario SSH
-    nuevo_user = input(f"👤 Usuario SSH (default del JSON: {username}): ").strip()
-    if nuevo_user:
-        username = nuevo_user
 
     # Ancho de canal: 20 o 40 MHz
     ancho = input(f"📶 Ancho de canal 20, 40 ó 80  MHz (default {canalbw}): ").strip()
@@ -349,48 +851,206 @@ def configurar_aps_estandar():
     sens = input(f"🎧 Sensibilidad RX, ej: -75db (default {sensibilidadrx}): ").strip()
     if sens:
         parametros["radio.1.rx_sensitivity"] = sens
+    return parametros
+
+
+def _ejecutar_con_progreso(fn, accion, firma=None):
+    """
+    Ejecuta fn(ip) (que retorna un Resultado) sobre los hosts mostrando cada
+    resultado y el progreso, e imprime el resumen con el detalle de los fallidos.
+    """
+    agregador = _ejecutar_agregando(fn, CATEGORIAS_CONFIGURACION, accion,
+                                    firma=firma)
+
+    print("\n   --- Resumen de configuración ---\n")
+    _imprimir_resumen(agregador, [estado for estado, _ in CATEGORIAS_CONFIGURACION
+                                  if estado not in (Estado.APLICADO, Estado.SIN_CAMBIOS)])
+    imprimir_stats_pool()
+
+
+def configurar_aps_estandar():
+    global hosts, username, password, alt_password, dry_run, do_reboot
+
+    if not hosts or not username or not password:
+        print("\n[ERROR] Primero debes ingresar los datos (opción 1 en el menú).")
+        presionar_tecla()
+        limpiar_pantalla()
+        return
+
+    print("\n--- Configuración personalizada (Enter para usar valores por defecto) ---")
+
+    # Usuario SSH
+    nuevo_user = input(f"👤 Usuario SSH (default del JSON: {username}): ").strip()
+    if nuevo_user:
+        username = nuevo_user
+
+    parametros = _pedir_parametros_ap()
+    if parametros is None:
+        return
 
     logging.info("      === Aplicando configuración estándar a APs AC ===\n")
-    resultados = []
-
-    for ip in hosts:
-        print(f"\n🔧 Configurando {ip} ...\n")
-        ssh = connect_device(ip, username, password, dry_run=dry_run, alt_password=alt_password)
-        if ssh is None:
-            msg = f"{ip}: ❌ Conexión fallida"
-            print(msg)
-            logging.error(msg)
-            resultados.append(msg)
-            continue
+    _ejecutar_con_progreso(functools.partial(_configurar_un_ap, parametros=parametros), "configuracion_ap",
+                           firma=_firma_trabajo("configuracion_ap", parametros=parametros))
+    presionar_tecla()
+    limpiar_pantalla()
 
-        try:
-            for clave, valor in parametros.items():
-                comando = f'sed -i "s|^{clave}=.*|{clave}={valor}|" /tmp/system.cfg'
-                if dry_run:
-                    print(f"[DRY-RUN] {ip}: {comando}")
-                else:
-                    ssh.exec_command(comando)
 
+@_cronometrado
+def _corregir_mtu_un_equipo(ip):
+    """Corrige ppp.1.mtu/mru a mtu_objetivo en un equipo y retorna un Resultado."""
+    ssh = _conectar(ip)
+    if ssh is None:
+        resultado = Resultado(ip, Estado.CONEXION_FALLIDA, f"Conexión fallida ({ultimo_error_conexion()})")
+        logging.error(resultado)
+        return resultado
+
+    ejecutor = ssh
+    try:
+        ejecutor = _ejecutor(ssh)
+        snapshot = None if dry_run else snapshots.obtener(ejecutor, ip)
+        r = corregir_mtu_pppoe(ejecutor, ip, dry_run=dry_run, do_reboot=do_reboot, snapshot=snapshot,
+                               mtu=mtu_objetivo)
+        actuales = ", ".join(f"{clave.split('.')[-1].upper()}: {valor or 'N/A'}" for clave, valor in r["antes"].items())
+        if r["estado"] == "ERROR":
+            return Resultado(ip, Estado.ERROR, f"Error corrigiendo MTU/MRU (exit code {r['exit_code']})",
+                             reporte=r["reporte"])
+        if r["estado"] == "SIN_LINEAS":
+            return Resultado(ip, Estado.SIN_CAMBIOS, "Sin líneas PPPoE para corregir", reporte=r["reporte"])
+        if r["estado"] == "SIN_CAMBIOS":
+            return Resultado(ip, Estado.SIN_CAMBIOS, f"MTU y MRU ya están correctos ({mtu_objetivo})",
+                             reporte=r["reporte"])
+        if r["reboot"] and not dry_run:
+            ssh_pool.discard(ssh)
+            hechos.invalidar(ip, "vida")
+            snapshots.invalidar(ip)
+        detalle = f"MTU/MRU PPPoE corregidos a {mtu_objetivo} ({actuales or 'dry-run'}){' y reboot' if r['reboot'] else ''}"
+        return Resultado(ip, Estado.APLICADO, detalle, reporte=r["reporte"])
+    except Exception as e:
+        resultado = _error_motor(ip, e, "Error corrigiendo MTU/MRU")
+        logging.error(resultado)
+        ssh_pool.discard(ssh)
+        return resultado
+    finally:
+        _cerrar_ejecutor(ejecutor, ssh)
+        ssh_pool.release(ssh)
+
+
+def corregir_mtu_action():
+    if not hosts or not username or not password:
+        print("\n[ERROR] Primero debes ingresar los datos (opción 1 en el menú).")
+        presionar_tecla()
+        limpiar_pantalla()
+        return
+    print(f"\n⚠️  Se corregirán ppp.1.mtu/mru a {mtu_objetivo} en los equipos que difieran ⚠️")
+    if input("¿Desea continuar? (Y/N): ").strip().upper() != "Y":
+        limpiar_pantalla()
+        return
+    logging.info(f"      === Corrigiendo MTU/MRU PPPoE a {mtu_objetivo} ===\n")
+    _ejecutar_con_progreso(_corregir_mtu_un_equipo, "mtu_pppoe", firma=_firma_trabajo("mtu_pppoe", mtu=mtu_objetivo))
+    presionar_tecla()
+    limpiar_pantalla()
+
+
+@_cronometrado
+def _trabajo_combinado_un_equipo(ip, acciones, parametros=None):
+    """
+    Junta en un único estado deseado las ediciones de las acciones elegidas
+    ("countrycode", "ap", "mtu") y las aplica en una sola transacción por
+    equipo: una lectura de system.cfg, un comando con todas las claves que
+    difieren y un único cfgmtd, y a lo sumo un reboot, en la misma sesión SSH.
+    Retorna un Resultado.
+    """
+    ssh = _conectar(ip)
+    if ssh is None:
+        resultado = Resultado(ip, Estado.CONEXION_FALLIDA, f"Conexión fallida ({ultimo_error_conexion()})")
+        logging.error(resultado)
+        return resultado
+
+    ejecutor = ssh
+    try:
+        ejecutor = _ejecutor(ssh)
+        snapshot = None if dry_run else snapshots.obtener(ejecutor, ip)
+        deseado = {}
+        if "countrycode" in acciones:
+            deseado.update(deseado_countrycode(snapshot, old_code, new_code))
+        if "ap" in acciones:
+            deseado.update(parametros)
+        if "mtu" in acciones:
+            deseado.update({"ppp.1.mtu": str(mtu_objetivo), "ppp.1.mru": str(mtu_objetivo)})
+
+        r = reconciliar(ejecutor, ip, snapshot, deseado, dry_run=dry_run)
+        reporte = r["reporte"]
+        if r["estado"] == "ERROR":
+            fallidas = [clave for clave, estado in reporte.items() if estado == "FALLO"]
+            resultado = Resultado(ip, Estado.ERROR, f"Error aplicando el trabajo combinado (fallidas: "
+                                  f"{', '.join(fallidas) or 'cfgmtd'})", reporte=reporte)
+            logging.error(resultado)
+            return resultado
+        countrycode = None
+        if snapshot is not None and "countrycode" in acciones:
+            countrycode = snapshot.countrycode()
+            hechos.registrar_countrycode(ip, countrycode)
+        if r["estado"] == "SIN_CAMBIOS":
+            resultado = Resultado(ip, Estado.SIN_CAMBIOS, "Sin cambios, no se escribe en flash ni se reinicia",
+                                  countrycode=countrycode, reporte=reporte)
+            logging.info(resultado)
+            return resultado
+
+        if do_reboot:
+            reboot_device(ejecutor, ip, dry_run=dry_run)
             if not dry_run:
-                persist_changes(ssh, ip, dry_run=False)
-                if do_reboot:
-                    reboot_device(ssh, ip, dry_run=False)
-
-            msg = f"\n{ip}: Configuración aplicada"
-            print(msg)
-            logging.info(msg)
-            resultados.append(msg)
-        except Exception as e:
-            msg = f"{ip}: Error durante la configuración - {e}"
-            print(msg)
-            logging.error(msg)
-            resultados.append(msg)
-        finally:
-            ssh.close()
+                ssh_pool.discard(ssh)
+                hechos.invalidar(ip, "vida")
+                snapshots.invalidar(ip)
+        resultado = Resultado(ip, Estado.APLICADO, f"{len(r['cambios'])} claves aplicadas en un único cfgmtd"
+                              f"{' y reboot' if do_reboot else ''}", countrycode=countrycode, reporte=reporte)
+        logging.info(resultado)
+        return resultado
+    except Exception as e:
+        resultado = _error_motor(ip, e, "Error durante el trabajo combinado")
+        logging.error(resultado)
+        ssh_pool.discard(ssh)
+        return resultado
+    finally:
+        _cerrar_ejecutor(ejecutor, ssh)
+        ssh_pool.release(ssh)
 
-    print("\n   --- Resumen de configuración ---\n")
-    for r in resultados:
-        print(r)
+
+def trabajo_combinado_action():
+    if not hosts or not username or not password:
+        print("\n[ERROR] Primero debes ingresar los datos (opción 1 en el menú).")
+        presionar_tecla()
+        limpiar_pantalla()
+        return
+
+    print("\n--- Trabajo combinado: un solo cfgmtd y a lo sumo un reboot por equipo ---")
+    print(f"1. Country code ({old_code} -> {new_code})")
+    print("2. Parámetros estándar de APs AC (config_ap_ac.json)")
+    print(f"3. MTU/MRU PPPoE ({mtu_objetivo})")
+    elegidas = input("Acciones a combinar, separadas por coma (ej: 1,3): ").replace(" ", "").split(",")
+    acciones = [nombre for opcion, nombre in (("1", "countrycode"), ("2", "ap"), ("3", "mtu")) if opcion in elegidas]
+    if not acciones:
+        print("Ninguna acción seleccionada.")
+        presionar_tecla()
+        limpiar_pantalla()
+        return
+
+    parametros = None
+    if "ap" in acciones:
+        parametros = _pedir_parametros_ap()
+        if parametros is None:
+            return
+
+    print("\n⚠️  ATENCIÓN: MODIFICACIONES PERMANENTES EN LOS APs Y CPEs ⚠️")
+    if input("¿Desea continuar? (Y/N): ").strip().upper() != "Y":
+        limpiar_pantalla()
+        return
+
+    logging.info(f"      === Trabajo combinado: {', '.join(acciones)} ===\n")
+    _ejecutar_con_progreso(functools.partial(_trabajo_combinado_un_equipo, acciones=acciones, parametros=parametros),
+                           "trabajo_combinado",
+                           firma=_firma_trabajo("trabajo_combinado", acciones=acciones, parametros=parametros,
+                                                old_code=old_code, new_code=new_code, mtu=mtu_objetivo))
     presionar_tecla()
     limpiar_pantalla()
 
@@ -402,8 +1062,10 @@ def menu_principal():
         print("2. Configurar parámetros estándar en APs AC")
         print("3. Consultar (verificar country code)")
         print("4. Modificar (actualizar country code)")
-        print("5. Salir") 
-        opcion = input("Seleccione una opción (1-5): ").strip()
+        print("5. Trabajo combinado (country code, parámetros AP y MTU en un solo guardado)")
+        print("6. Corregir MTU/MRU PPPoE")
+        print("7. Salir") 
+        opcion = input("Seleccione una opción (1-7): ").strip()
         if opcion == "1":
             limpiar_pantalla()
             input_data()
@@ -421,7 +1083,14 @@ def menu_principal():
                 update_country_code_action()
             limpiar_pantalla()
         elif opcion == "5":
+            limpiar_pantalla()
+            trabajo_combinado_action()
+        elif opcion == "6":
+            limpiar_pantalla()
+            corregir_mtu_action()
+        elif opcion == "7":
             print("Saliendo del programa.")
+            ssh_pool.close_all()
             limpiar_pantalla()
             break
         else:
@@ -430,8 +1099,10 @@ def menu_principal():
             limpiar_pantalla()
 
 def main():
+    inicializar()
     limpiar_pantalla()
     menu_principal()
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # necesario para el motor "procesos" en el ejecutable de PyInstaller
     main()
@@ -0,0 +1,129 @@
+import itertools
+import logging
+import queue
+import threading
+import time
+
+# Pipeline de dos etapas para el motor de hilos.
+#  1. Vida: pocos hilos toman lotes de hosts del iterador y los sondean en lote
+#     (ICMP/TCP, concurrentes dentro del sondeo). Los que no responden se
+#     informan directamente; los vivos pasan a una cola acotada.
+#  2. SSH: un grupo de hilos dimensionado para paramiko consume la cola.
+# Si la etapa SSH se atrasa, la cola se llena y la etapa de vida espera
+# (contrapresión), así nunca hay más de 'capacidad' equipos vivos esperando.
+# El tiempo de la etapa de vida se mide sólo dentro de etapa_vida, sin las
+# esperas por contrapresión, para que su throughput no repita el de SSH.
+
+_FIN = object()
+
+
+def ejecutar_en_etapas(hosts, etapa_vida, etapa_ssh, hilos_ssh, hilos_vida=4, lote_vida=1024, capacidad=None,
+                       al_completar=None, acumular=True, resultado_error=None):
+    """
+    - etapa_vida(lote): retorna [(ip, fallo)] con fallo None si hay que seguir
+      con la etapa SSH, o el resultado a informar si no responde.
+    - etapa_ssh(ip): función bloqueante (connect + comandos) que retorna el resultado.
+    - hilos_ssh / hilos_vida: hilos de cada etapa; lote_vida: hosts por sondeo.
+    - capacidad: equipos vivos en espera de SSH (por defecto 2 x hilos_ssh).
+    - al_completar(resultado): se llama desde el hilo que invoca, a medida que terminan.
+    - acumular: False para no guardar los resultados.
+    - resultado_error(ip, excepción): arma el resultado si una etapa falla.
+    Retorna (resultados, estadisticas) con estadisticas = {"vida": {...}, "ssh": {...}}
+    (cantidades, vivos y segundos de cada etapa). Los segundos de vida son el tiempo
+    ocupado dentro de etapa_vida sumado entre sus hilos y dividido por hilos_vida;
+    "espera" es el tiempo (igual promediado) bloqueado por contrapresión.
+    """
+    hosts = iter(hosts)
+    lock_hosts = threading.Lock()
+    cola_ssh = queue.Queue(maxsize=capacidad or 2 * hilos_ssh)
+    salida = queue.Queue()
+    stats = {"vida": {"hosts": 0, "vivos": 0, "ocupado": 0.0, "espera": 0.0},
+             "ssh": {"equipos": 0, "inicio": None, "fin": None}}
+    lock_stats = threading.Lock()
+    hilos_vida = max(1, hilos_vida)
+    vida_activos = [hilos_vida]
+
+    def error(ip, e):
+        return resultado_error(ip, e) if resultado_error else f"{ip}: Error - {e}"
+
+    def trabajador_vida():
+        try:
+            while True:
+                with lock_hosts:
+                    lote = list(itertools.islice(hosts, lote_vida))
+                if not lote:
+                    return
+                inicio = time.monotonic()
+                try:
+                    clasificados = etapa_vida(lote)
+                except Exception as e:
+                    logging.error(f"Error en la etapa de vida ({len(lote)} hosts): {e}")
+                    clasificados = [(ip, error(ip, e)) for ip in lote]
+                ocupado = time.monotonic() - inicio
+                vivos = 0
+                for ip, fallo in clasificados:
+                    if fallo is None:
+                        vivos += 1
+                        cola_ssh.put(ip)  # bloquea si la etapa SSH está saturada
+                    else:
+                        salida.put(fallo)
+                with lock_stats:
+                    stats["vida"]["hosts"] += len(lote)
+                    stats["vida"]["vivos"] += vivos
+                    stats["vida"]["ocupado"] += ocupado
+                    stats["vida"]["espera"] += time.monotonic() - inicio - ocupado
+        finally:
+            with lock_stats:
+                vida_activos[0] -= 1
+                ultimo = vida_activos[0] == 0
+            if ultimo:
+                for _ in range(hilos_ssh):
+                    cola_ssh.put(_FIN)
+
+    def trabajador_ssh():
+        try:
+            while True:
+                ip = cola_ssh.get()
+                if ip is _FIN:
+                    return
+                with lock_stats:
+                    if stats["ssh"]["inicio"] is None:
+                        stats["ssh"]["inicio"] = time.monotonic()
+                try:
+                    resultado = etapa_ssh(ip)
+                except Exception as e:
+                    logging.error(f"{ip}: Error en la etapa SSH - {e}")
+                    resultado = error(ip, e)
+                with lock_stats:
+                    stats["ssh"]["equipos"] += 1
+                    stats["ssh"]["fin"] = time.monotonic()
+                salida.put(resultado)
+        finally:
+            salida.put(_FIN)
+
+    hilos = [threading.Thread(target=trabajador_vida, daemon=True) for _ in range(hilos_vida)]
+    hilos += [threading.Thread(target=trabajador_ssh, daemon=True) for _ in range(hilos_ssh)]
+    for hilo in hilos:
+        hilo.start()
+
+    resultados = []
+    pendientes = hilos_ssh
+    while pendientes:
+        resultado = salida.get()
+        if resultado is _FIN:
+            pendientes -= 1
+            continue
+        if acumular:
+            resultados.append(resultado)
+        if al_completar:
+            al_completar(resultado)
+    for hilo in hilos:
+        hilo.join()
+
+    estadisticas = {
+        "vida": {"hosts": stats["vida"]["hosts"], "vivos": stats["vida"]["vivos"],
+                 "segundos": stats["vida"]["ocupado"] / hilos_vida, "espera": stats["vida"]["espera"] / hilos_vida},
+        "ssh": {"equipos": stats["ssh"]["equipos"],
+                "segundos": (stats["ssh"]["fin"] - stats["ssh"]["inicio"]) if stats["ssh"]["inicio"] else 0.0},
+    }
+    return resultados, estadisticas
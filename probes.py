@@ -0,0 +1,241 @@
+import errno
+import ipaddress
+import itertools
+import logging
+import os
+import select
+import selectors
+import socket
+import struct
+import time
+from collections import namedtuple
+
+# Sondeo de vida en lote, dentro del proceso (sin un 'ping' por host).
+#  - barrer_icmp: envía ICMP echo a toda la lista desde un único socket y
+#    empareja las respuestas por identificador/secuencia.
+#  - sondear_tcp: connect() no bloqueante al puerto 22, multiplexado con selectors.
+
+ResultadoSondeo = namedtuple("ResultadoSondeo", ["vivo", "rtt_ms", "perdida"])
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+# Identificador ICMP distinto por barrido: con varios barridos simultáneos en el
+# mismo proceso (hilos de la etapa de vida), cada socket raw descarta de entrada
+# las respuestas de los demás.
+_idents = itertools.count(os.getpid())
+_EN_CURSO = {0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY, 10035}  # 10035 = WSAEWOULDBLOCK
+
+
+def _checksum(data):
+    if len(data) % 2:
+        data += b"\x00"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def _paquete_echo(ident, seq):
+    payload = b"IspTools" + struct.pack("!d", time.time())
+    cabecera = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, 0, ident, seq)
+    suma = _checksum(cabecera + payload)
+    return struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, suma, ident, seq) + payload
+
+
+def _abrir_socket_icmp():
+    """
+    Intenta un socket ICMP raw (requiere root/admin) y luego uno datagrama
+    no privilegiado (Linux con net.ipv4.ping_group_range, macOS).
+    Retorna (modo, socket) o (None, None) si no hay ICMP disponible.
+    """
+    for modo, tipo in (("raw", socket.SOCK_RAW), ("dgram", socket.SOCK_DGRAM)):
+        try:
+            sock = socket.socket(socket.AF_INET, tipo, socket.IPPROTO_ICMP)
+        except (PermissionError, OSError):
+            continue
+        sock.setblocking(False)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        except OSError:
+            pass
+        return modo, sock
+    return None, None
+
+
+def _resolver(hosts):
+    """Retorna {direccion_ipv4: [hosts_originales]}; los nombres que no resuelven se marcan muertos."""
+    direcciones = {}
+    fallidos = []
+    for host in hosts:
+        try:
+            direccion = str(ipaddress.IPv4Address(host))
+        except ValueError:
+            try:
+                direccion = socket.gethostbyname(host)
+            except OSError:
+                fallidos.append(host)
+                continue
+        direcciones.setdefault(direccion, []).append(host)
+    return direcciones, fallidos
+
+
+def _resumir(enviados, rtts, hosts):
+    resultados = {}
+    for host in hosts:
+        lista = rtts.get(host, [])
+        total = enviados.get(host, 0) or 1
+        resultados[host] = ResultadoSondeo(
+            bool(lista),
+            round(min(lista), 2) if lista else None,
+            round(1 - len(lista) / total, 2),
+        )
+    return resultados
+
+
+def barrer_icmp(hosts, intentos=1, timeout=1.0, pps=10000, puerto_fallback=22):
+    """
+    Envía 'intentos' ICMP echo a cada host desde un único socket, a 'pps'
+    paquetes por segundo (si hay varios barridos simultáneos, 'pps' debe ser
+    la parte de cada uno en la tasa total), y espera respuestas hasta 'timeout' segundos después
+    del último envío. Si no se puede abrir un socket ICMP, hace un sondeo TCP
+    al 'puerto_fallback'.
+    Retorna {host: ResultadoSondeo(vivo, rtt_ms, perdida)}.
+    """
+    hosts = list(hosts)
+    modo, sock = _abrir_socket_icmp()
+    if sock is None:
+        logging.warning("Sin permisos para ICMP (raw ni datagrama); se usa sondeo TCP/%s.", puerto_fallback)
+        return sondear_tcp(hosts, puerto=puerto_fallback, timeout=timeout)
+
+    inicio = time.monotonic()
+    direcciones, fallidos = _resolver(hosts)
+    ident = next(_idents) & 0xFFFF
+    enviados = {}      # direccion -> cantidad de echo enviados
+    en_vuelo = {}      # (direccion, seq) -> instante de envío
+    rtts = {}          # direccion -> [rtt_ms, ...]
+    intervalo = 1.0 / pps if pps else 0.0
+
+    def recibir(espera):
+        listos, _, _ = select.select([sock], [], [], espera)
+        if not listos:
+            return
+        while True:
+            try:
+                datos, (origen, _) = sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            # raw (y dgram en macOS) incluyen la cabecera IP
+            if datos and datos[0] >> 4 == 4:
+                datos = datos[(datos[0] & 0x0F) * 4:]
+            if len(datos) < 8:
+                continue
+            tipo, _, _, r_ident, r_seq = struct.unpack("!BBHHH", datos[:8])
+            if tipo != ICMP_ECHO_REPLY or (modo == "raw" and r_ident != ident):
+                continue
+            enviado = en_vuelo.pop((origen, r_seq), None)
+            if enviado is not None:
+                rtts.setdefault(origen, []).append((time.monotonic() - enviado) * 1000)
+
+    try:
+        seq = 0
+        proximo = time.monotonic()
+        for _ in range(intentos):
+            for direccion in direcciones:
+                if direccion in rtts:
+                    continue  # ya respondió en un intento anterior
+                seq = (seq + 1) & 0xFFFF
+                while True:
+                    try:
+                        sock.sendto(_paquete_echo(ident, seq), (direccion, 0))
+                        break
+                    except (BlockingIOError, InterruptedError):
+                        select.select([], [sock], [], 0.01)
+                    except OSError as e:
+                        logging.debug(f"ICMP a {direccion}: {e}")
+                        break
+                en_vuelo[(direccion, seq)] = time.monotonic()
+                enviados[direccion] = enviados.get(direccion, 0) + 1
+                proximo += intervalo
+                restante = proximo - time.monotonic()
+                recibir(restante if restante > 0 else 0)
+            limite = time.monotonic() + timeout
+            while en_vuelo and time.monotonic() < limite:
+                recibir(limite - time.monotonic())
+            en_vuelo.clear()
+    finally:
+        sock.close()
+
+    por_direccion = _resumir(enviados, rtts, direcciones)
+    resultados = {host: por_direccion[d] for d, lista in direcciones.items() for host in lista}
+    for host in fallidos:
+        resultados[host] = ResultadoSondeo(False, None, 1.0)
+    vivos = sum(1 for r in resultados.values() if r.vivo)
+    logging.info(f"Barrido ICMP ({modo}): {vivos}/{len(hosts)} vivos en {time.monotonic() - inicio:.1f}s")
+    return resultados
+
+
+def sondear_tcp(hosts, puerto=22, timeout=1.0, concurrentes=512):
+    """
+    Sondea el puerto TCP 'puerto' de cada host con connect() no bloqueante,
+    manteniendo hasta 'concurrentes' conexiones en curso en un selector.
+    Un host está vivo si el puerto acepta la conexión.
+    Retorna {host: ResultadoSondeo(vivo, rtt_ms, perdida)}.
+    """
+    inicio = time.monotonic()
+    sel = selectors.DefaultSelector()
+    pendientes = iter(hosts)
+    en_curso = {}      # socket -> (host, instante)
+    enviados = {}
+    rtts = {}
+    total = 0
+
+    def lanzar():
+        nonlocal total
+        while len(en_curso) < concurrentes:
+            host = next(pendientes, None)
+            if host is None:
+                return
+            total += 1
+            enviados[host] = 1
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setblocking(False)
+            try:
+                err = sock.connect_ex((host, puerto))
+            except OSError:
+                err = -1
+            if err not in _EN_CURSO:
+                sock.close()
+                continue
+            en_curso[sock] = (host, time.monotonic())
+            sel.register(sock, selectors.EVENT_WRITE)
+
+    def cerrar(sock):
+        sel.unregister(sock)
+        sock.close()
+        return en_curso.pop(sock)
+
+    try:
+        lanzar()
+        while en_curso:
+            for key, _ in sel.select(timeout=0.05):
+                sock = key.fileobj
+                err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                host, t0 = cerrar(sock)
+                if err == 0:
+                    rtts[host] = [(time.monotonic() - t0) * 1000]
+            ahora = time.monotonic()
+            for sock, (host, t0) in list(en_curso.items()):
+                if ahora - t0 > timeout:
+                    cerrar(sock)
+            lanzar()
+    finally:
+        for sock in list(en_curso):
+            cerrar(sock)
+        sel.close()
+
+    resultados = _resumir(enviados, rtts, enviados)
+    vivos = sum(1 for r in resultados.values() if r.vivo)
+    logging.info(f"Sondeo TCP/{puerto}: {vivos}/{total} responden en {time.monotonic() - inicio:.1f}s")
+    return resultados
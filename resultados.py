@@ -0,0 +1,68 @@
+import enum
+from collections import namedtuple
+
+# Resultado tipado por equipo, compartido por todas las acciones del menú.
+# El resumen se arma contando por 'estado' (sin buscar texto en los mensajes)
+# y cada registro se exporta tal cual al JSONL de la acción.
+
+
+class Estado(enum.Enum):
+    """Estado final de un equipo. El valor es el nombre de la categoría en los resúmenes."""
+    SIN_PING = "No responde ping"
+    SIN_SSH = "No responde SSH"
+    CONEXION_FALLIDA = "Conexión fallida"
+    ERROR = "Error"
+    TIMEOUT = "Timeout"
+    # Verificación de country code
+    ARGENTINA = "Argentina (32)"
+    LICENSED = "Licensed (511)"
+    INCONSISTENTE = "Inconsistente"
+    DESCONOCIDO = "Desconocido"
+    # Acciones que modifican
+    ACTUALIZADO = "Actualizado"
+    APLICADO = "Aplicado"
+    SIN_CAMBIOS = "Sin cambios"
+
+
+ESTADOS_FALLIDOS = {Estado.SIN_PING, Estado.SIN_SSH, Estado.CONEXION_FALLIDA, Estado.ERROR, Estado.TIMEOUT}
+
+_Campos = namedtuple(
+    "Resultado",
+    ["ip", "estado", "detalle", "countrycode", "reporte", "t_conexion_ms", "t_total_ms"],
+    defaults=(None, None, None, None),
+)
+
+
+class Resultado(_Campos):
+    """
+    Resultado de un equipo:
+    - estado: Estado; detalle: texto para mostrar (sin la IP).
+    - countrycode: dict de countrycode leído (o confirmado) del equipo, si aplica.
+    - reporte: {clave: OK | SIN_CAMBIO | AUSENTE | FALLO} de las acciones que aplican parámetros.
+    - t_conexion_ms / t_total_ms: tiempo del handshake SSH y de toda la etapa SSH.
+    """
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        return self.estado not in ESTADOS_FALLIDOS
+
+    def __str__(self):
+        return f"{self.ip}: {self.detalle}"
+
+    def a_dict(self):
+        d = self._asdict()
+        d["estado"] = self.estado.name
+        return d
+
+    @classmethod
+    def desde_dict(cls, d):
+        return cls(**dict(d, estado=Estado[d["estado"]]))
+
+
+def estado_countrycode(valores):
+    """Estado de verificación según los valores de countrycode de check_country_mode."""
+    distintos = set(valores.values())
+    if len(distintos) != 1:
+        return Estado.INCONSISTENTE
+    return {"32": Estado.ARGENTINA, "511": Estado.LICENSED}.get(distintos.pop(), Estado.DESCONOCIDO)
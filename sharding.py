@@ -0,0 +1,89 @@
+import concurrent.futures
+import functools
+import itertools
+import logging
+import multiprocessing
+
+from concurrency import mapear_acotado
+
+
+# Ejecución híbrida procesos + hilos.
+# Con muchos hilos el GIL pasa a ser el límite: el KEX y el cifrado de paramiko
+# corren en Python. Aquí los hosts se reparten en lotes chicos entre N procesos
+# y cada proceso recorre su lote con su propio ThreadPoolExecutor. Los lotes se
+# arman a demanda desde el iterador de hosts y sólo unos pocos por proceso están
+# enviados a la vez, así los resultados vuelven (y se muestran) a medida que
+# terminan y la memoria no depende del largo de la lista.
+
+
+def lotes(hosts, tamanio):
+    """Genera listas de hasta 'tamanio' hosts tomadas del iterador, sin materializarlo."""
+    hosts = iter(hosts)
+    while True:
+        lote = list(itertools.islice(hosts, tamanio))
+        if not lote:
+            return
+        yield lote
+
+
+def _ejecutar_shard(fn, shard, hilos, etapa_vida=None, recolectar=None):
+    """
+    Sondea el lote con etapa_vida (si se pasó) y corre fn sobre los vivos.
+    Retorna (resultados, recolectar()); lo recolectado es None si no se pasó recolectar.
+    """
+    resultados = []
+    if etapa_vida is not None:
+        clasificados = etapa_vida(shard)
+        resultados = [fallo for _, fallo in clasificados if fallo is not None]
+        shard = [ip for ip, fallo in clasificados if fallo is None]
+    if shard:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(hilos, len(shard)))) as executor:
+            futures = [executor.submit(fn, ip) for ip in shard]
+            for future in concurrent.futures.as_completed(futures):
+                resultados.append(future.result())
+    return resultados, recolectar() if recolectar else None
+
+
+def ejecutar_en_procesos(hosts, fn, procesos, hilos_por_proceso, etapa_vida=None, inicializador=None, initargs=(),
+                         al_completar=None, acumular=True, lote=None, lotes_por_proceso=2,
+                         recolectar=None, al_recolectar=None):
+    """
+    Ejecuta fn(ip) para cada host repartiendo los hosts en lotes de 'lote'
+    (por defecto 8 x hilos_por_proceso) entre 'procesos' procesos, cada uno con
+    'hilos_por_proceso' hilos; a lo sumo lotes_por_proceso x procesos lotes
+    están enviados a la vez. Si se pasa etapa_vida(lote) (retorna [(ip, fallo)],
+    como en pipeline.py), cada proceso sondea su lote de una vez y fn sólo corre
+    sobre los hosts con fallo None. fn, etapa_vida e inicializador deben ser funciones
+    de nivel de módulo (se envían por pickle). Se usa el método 'spawn' en todas
+    las plataformas: los procesos hijos no heredan sockets ni sesiones SSH abiertas
+    del proceso principal, y 'inicializador(*initargs)' debe cargar en cada hijo
+    el estado que fn necesita. al_completar(resultado) se llama en el proceso
+    principal a medida que llega cada lote. Con acumular=False los resultados
+    sólo llegan a al_completar y no se guardan.
+    recolectar() (de nivel de módulo) se llama en el hijo al terminar cada lote
+    y lo que retorne (p. ej. credenciales aprendidas) se entrega en el proceso
+    principal a al_recolectar(dato), para que el estado aprendido en los hijos
+    no se pierda con ellos.
+    Retorna la lista de resultados de todos los procesos (vacía si acumular=False).
+    """
+    total = len(hosts)
+    n_procesos = max(1, min(procesos, total))
+    lote = lote or max(1, 8 * hilos_por_proceso)
+    logging.info(f"Modo procesos: {total} hosts en {n_procesos} procesos x {hilos_por_proceso} hilos "
+                 f"(lotes de {lote})")
+    resultados = []
+    ctx = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(n_procesos, mp_context=ctx, initializer=inicializador,
+                                                initargs=initargs) as pool:
+        ejecutar_lote = functools.partial(_ejecutar_shard, fn, hilos=hilos_por_proceso, etapa_vida=etapa_vida,
+                                          recolectar=recolectar)
+        for parcial, recolectado in mapear_acotado(pool, ejecutar_lote, lotes(hosts, lote),
+                                                   lotes_por_proceso * n_procesos):
+            if al_recolectar and recolectado is not None:
+                al_recolectar(recolectado)
+            if acumular:
+                resultados.extend(parcial)
+            if al_completar:
+                for resultado in parcial:
+                    al_completar(resultado)
+    return resultados
@@ -0,0 +1,89 @@
+import logging
+import threading
+import time
+
+# system.cfg leído una sola vez por equipo y consultado en memoria.
+# Las consultas (countrycode, ppp.1.mtu/mru, radio.1.* de config_ap_ac.json)
+# se responden sobre el snapshot y al equipo sólo se envía la diferencia.
+
+CLAVES_COUNTRYCODE = ("radio.countrycode", "radio.1.countrycode")
+
+
+class SnapshotConfig:
+    """Modelo clave=valor de un system.cfg, en el orden del archivo."""
+    def __init__(self, texto):
+        self.valores = {}
+        for linea in texto.splitlines():
+            if "=" in linea:
+                clave, valor = linea.split("=", 1)
+                self.valores[clave.strip()] = valor.strip()
+
+    def __contains__(self, clave):
+        return clave in self.valores
+
+    def get(self, clave, default=None):
+        return self.valores.get(clave, default)
+
+    def countrycode(self):
+        """Igual que check_country_mode: sin líneas de countrycode se asume Licensed (511)."""
+        cc = {clave: self.valores[clave] for clave in CLAVES_COUNTRYCODE if clave in self.valores}
+        return cc or {"radio.countrycode": "511"}
+
+    def diff(self, deseado):
+        """Claves existentes cuyo valor difiere del deseado: {clave: valor_deseado}."""
+        return {clave: str(valor) for clave, valor in deseado.items()
+                if clave in self.valores and self.valores[clave] != str(valor)}
+
+    def ausentes(self, deseado):
+        """Claves deseadas que no existen en el archivo (no se agregan)."""
+        return [clave for clave in deseado if clave not in self.valores]
+
+    def actualizar(self, cambios):
+        """Refleja en el modelo los cambios ya aplicados en el equipo."""
+        self.valores.update({clave: str(valor) for clave, valor in cambios.items()})
+
+
+def leer_snapshot(ssh, ip, remote_filepath="/tmp/system.cfg"):
+    """Trae el archivo completo en un solo comando (cat) y lo parsea."""
+    stdin, stdout, stderr = ssh.exec_command(f"cat {remote_filepath}")
+    texto = stdout.read().decode(errors="replace")
+    exit_code = stdout.channel.recv_exit_status()
+    if exit_code != 0:
+        raise Exception(f"no se pudo leer {remote_filepath} (exit code {exit_code}): {stderr.read().decode().strip()}")
+    snapshot = SnapshotConfig(texto)
+    logging.info(f"[{ip}] Leído {remote_filepath}: {len(snapshot.valores)} claves.")
+    return snapshot
+
+
+class SnapshotStore:
+    """
+    Snapshots por IP vigentes durante 'ttl' segundos, para que una misma
+    ejecución (y las acciones que siguen) lean system.cfg una sola vez.
+    """
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._snapshots = {}   # ip -> (instante, SnapshotConfig)
+
+    def cacheado(self, ip):
+        with self._lock:
+            dato = self._snapshots.get(ip)
+        if dato is None or time.monotonic() - dato[0] > self.ttl:
+            return None
+        return dato[1]
+
+    def obtener(self, ssh, ip, remote_filepath="/tmp/system.cfg", dry_run=False):
+        """Retorna el snapshot vigente o lo lee del equipo. En dry-run se simula y no se guarda."""
+        if dry_run:
+            logging.info(f"[{ip}] DRY-RUN: Se ejecutaría: cat {remote_filepath}")
+            return SnapshotConfig("radio.countrycode=32\nradio.1.countrycode=32\n")
+        snapshot = self.cacheado(ip)
+        if snapshot is None:
+            snapshot = leer_snapshot(ssh, ip, remote_filepath)
+            with self._lock:
+                self._snapshots[ip] = (time.monotonic(), snapshot)
+        return snapshot
+
+    def invalidar(self, ip):
+        with self._lock:
+            self._snapshots.pop(ip, None)
@@ -1,11 +1,15 @@
 import re
 import os
+import logging
+import contextlib
 import time
 import sys
 import subprocess
 import platform
 import json
 import getpass
+import queue
+import threading
 from datetime import datetime
 from rich.console import Console
 from rich.table import Table
@@ -57,6 +61,150 @@ def print_with_pagination(items, page_size=20):
             presionar_tecla()
 
 
+# 🖨️ Único escritor de consola para acciones concurrentes
+class EscritorConsola:
+    """
+    Serializa la salida de varios hilos en un único hilo escritor, para que
+    las líneas de distintos equipos no se mezclen. Mantiene además una línea
+    de progreso al pie que se reescribe en el lugar.
+    """
+
+    def __init__(self):
+        self._cola = queue.Queue()
+        self._progreso = ""
+        self._hilo = threading.Thread(target=self._escribir, daemon=True)
+        self._hilo.start()
+
+    def escribir(self, texto):
+        self._cola.put(("linea", texto))
+
+    def progreso(self, texto):
+        self._cola.put(("progreso", texto))
+
+    def cerrar(self):
+        self._cola.put(None)
+        self._hilo.join()
+
+    def _escribir(self):
+        while True:
+            item = self._cola.get()
+            if item is None:
+                break
+            tipo, texto = item
+            # Se borra la línea de progreso actual rellenando con espacios
+            sys.stdout.write("\r" + " " * len(self._progreso) + "\r")
+            if tipo == "linea":
+                sys.stdout.write(texto + "\n" + self._progreso)
+            else:
+                self._progreso = texto
+                sys.stdout.write(texto)
+            sys.stdout.flush()
+        if self._progreso:
+            sys.stdout.write("\n")
+            sys.stdout.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+
+class LogAEscritor(logging.Handler):
+    """Handler de logging que escribe cada registro como una línea del EscritorConsola."""
+
+    def __init__(self, escritor, level=logging.NOTSET):
+        super().__init__(level)
+        self._escritor = escritor
+
+    def emit(self, record):
+        try:
+            self._escritor.escribir(self.format(record))
+        except Exception:
+            self.handleError(record)
+
+
+@contextlib.contextmanager
+def log_por_escritor(escritor, logger, handler):
+    """
+    Mientras dura el bloque, lo que 'handler' (el de consola) mostraría pasa
+    por 'escritor' con el mismo nivel y formato, así los logs de los hilos no
+    se mezclan con la línea de progreso. Con handler None no hace nada.
+    """
+    if handler is None:
+        yield
+        return
+    reemplazo = LogAEscritor(escritor, handler.level)
+    reemplazo.setFormatter(handler.formatter)
+    logger.removeHandler(handler)
+    logger.addHandler(reemplazo)
+    try:
+        yield
+    finally:
+        logger.removeHandler(reemplazo)
+        logger.addHandler(handler)
+
+
+# 📈 Agregación de resultados a medida que terminan los equipos
+class AgregadorResultados:
+    """
+    Cuenta cada resultado apenas llega según su 'estado', lo muestra (si hay
+    EscritorConsola) y lo agrega como una línea JSON en 'ruta'. No guarda los
+    resultados en memoria; el detalle de un estado se relee del archivo con
+    detalle().
+    - categorias: lista ordenada de (estado, icono); el nombre de la categoría
+      es estado.value.
+    Los resultados deben tener 'estado', 'a_dict()' y str() (resultados.Resultado).
+    registrar() debe llamarse desde un único hilo (el al_completar de _ejecutar_accion).
+    """
+
+    def __init__(self, ruta, categorias, escritor=None, total=None):
+        self.ruta = ruta
+        self.iconos = dict(categorias)
+        self.conteo = {estado: 0 for estado, _ in categorias}
+        self.total = total
+        self._escritor = escritor
+        self._archivo = open(ruta, "w", encoding="utf-8", buffering=1)
+
+    def registrar(self, resultado):
+        self.conteo[resultado.estado] = self.conteo.get(resultado.estado, 0) + 1
+        registro = dict(resultado.a_dict(), fecha=datetime.now().isoformat(timespec="seconds"))
+        self._archivo.write(json.dumps(registro, ensure_ascii=False) + "\n")
+        if self._escritor:
+            self._escritor.escribir(f"{self.icono(resultado.estado)} {resultado}")
+            self._escritor.progreso(self.linea_progreso())
+
+    def icono(self, estado):
+        return self.iconos.get(estado, "•")
+
+    def procesados(self):
+        return sum(self.conteo.values())
+
+    def linea_progreso(self):
+        total = f"/{self.total}" if self.total is not None else ""
+        partes = " | ".join(f"{self.icono(e)} {e.value}: {n}" for e, n in self.conteo.items() if n)
+        return f"[{self.procesados()}{total}] {partes}"
+
+    def detalle(self, estado):
+        """Genera las líneas de un estado leyendo el archivo, sin cargarlo entero."""
+        if not self._archivo.closed:
+            self._archivo.flush()
+        with open(self.ruta, encoding="utf-8") as f:
+            for linea in f:
+                registro = json.loads(linea)
+                if registro["estado"] == estado.name:
+                    yield f"{self.icono(estado)} {registro['ip']}: {registro['detalle']}"
+
+    def cerrar(self):
+        self._archivo.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+
 # 📂 Cargar credenciales desde JSON
 def cargar_credenciales():
     import json